@@ -1,16 +1,24 @@
+import time
+
+# Taken before the other imports so the first run of a fresh process includes them
+PAGE_START = time.perf_counter()
+
 import sys
 import os
+import threading
 import streamlit as st
 import cv2
 import numpy as np
 import json
 from PIL import Image
 from streamlit_drawable_canvas import st_canvas
-from logger_config import setup_logger
-from processing.track_video import process_video
+from logger_config import every, setup_logger
 from config import INPUT_DIR, OUTPUT_DIR, TEMP_DIR
 from tools.draw_roi import draw_polygon_with_opencv
-from tools.rtsp_helper import get_rtsp_streams, safe_rtsp_url, fetch_rtsp_frame_ffmpeg
+from tools.rtsp_helper import SnapshotCache, get_rtsp_streams, safe_rtsp_url, fetch_rtsp_frame_ffmpeg
+from tools.ffmpeg_reader import probe_stream
+from processing.metrics import metrics
+from processing.result_cache import ResultCache, cache_key, read_rows, save_upload, stream_hash
 
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 if ROOT_DIR not in sys.path:
@@ -18,14 +26,56 @@ if ROOT_DIR not in sys.path:
 
 logger = setup_logger()
 
+@st.cache_resource(show_spinner=False)
+def startup_timings():
+    return {}
+
+@st.cache_resource(show_spinner=False)
+def warm_detector():
+    # Shared by every session and rerun in this process; the model loads while the user draws the ROI
+    def load():
+        from processing.track_video import get_detector
+
+        start = time.perf_counter()
+        get_detector()
+        startup_timings()["detector_ready_s"] = round(time.perf_counter() - start, 2)
+
+    loader = threading.Thread(target=load, name="detector-warmup", daemon=True)
+    loader.start()
+    return loader
+
+@st.cache_resource(show_spinner=False)
+def result_cache():
+    return ResultCache()
+
+@st.cache_resource(show_spinner=False)
+def snapshot_cache():
+    return SnapshotCache()
+
+def show_results(files):
+    if "video" in files:
+        st.video(files["video"])
+    rows = read_rows(files["csv"])
+    st.write(f"📄 {len(rows)} vehicle speed(s) logged to {files['csv']}")
+    if rows:
+        st.dataframe(rows)
+
 st.set_page_config(layout="wide")
 st.title("🚗 Vehicle Speed Detection with ROI and Virtual Lines")
 
 st.sidebar.title("📡 RTSP Camera Stream")
 use_rtsp = st.sidebar.checkbox("Use RTSP stream instead of uploaded video")
 
+show_metrics = st.sidebar.checkbox("Show pipeline metrics")
+if show_metrics:
+    metrics_port = os.getenv("METRICS_PORT")
+    metrics.enable(port=int(metrics_port) if metrics_port else None)
+else:
+    metrics.disable()
+
 input_path = None
 video_name = None
+video_hash = None
 
 if use_rtsp:
     try:
@@ -36,6 +86,15 @@ if use_rtsp:
             selected_name = st.sidebar.selectbox("Select Camera Stream", list(stream_dict.keys()))
             selected_rtsp_url = stream_dict.get(selected_name)
 
+            if st.sidebar.checkbox("Show camera previews"):
+                # Previews still loading show up on a later rerun instead of blocking this one
+                thumbs = snapshot_cache().get_many(list(stream_dict.values()), timeout=1.0)
+                for name, url in stream_dict.items():
+                    if thumbs[url] is None:
+                        st.sidebar.caption(f"{name}: loading preview...")
+                    else:
+                        st.sidebar.image(cv2.cvtColor(thumbs[url], cv2.COLOR_BGR2RGB), caption=name)
+
             # Encode RTSP URL safely
             input_path = safe_rtsp_url(selected_rtsp_url)
             video_name = selected_name.replace(" ", "_") + ".mp4"
@@ -51,20 +110,45 @@ else:
     uploaded_file = st.file_uploader("Upload a video file", type=["mp4", "avi", "mov"])
     if uploaded_file:
         input_path = os.path.join(INPUT_DIR, uploaded_file.name)
-        with open(input_path, "wb") as f:
-            f.write(uploaded_file.read())
+        saved = st.session_state.get("upload")
+        # Every widget interaction reruns the script; write each upload once. Without a file id,
+        # the in-memory upload is re-hashed so a different file under the same name is still noticed.
+        file_id = getattr(uploaded_file, "file_id", None)
+        if saved is None or saved["path"] != input_path or not os.path.exists(input_path):
+            changed = True
+        elif file_id is not None:
+            changed = saved["file_id"] != file_id
+        else:
+            changed = saved["hash"] != stream_hash(uploaded_file)
+        if changed:
+            saved = {"file_id": file_id, "path": input_path, "hash": save_upload(uploaded_file, input_path)}
+            st.session_state["upload"] = saved
+            logger.info(f"Video saved to {input_path} (sha256 {saved['hash'][:12]})")
+        video_hash = saved["hash"]
 
-        logger.info(f"Video saved to {input_path}")
         st.success("✅ Video uploaded successfully!")
         video_name = uploaded_file.name
 
+warm_detector()
+timings = startup_timings()
+if "first_page_s" not in timings:
+    timings["first_page_s"] = round(time.perf_counter() - PAGE_START, 2)
+    logger.info(f"Time to first page: {timings['first_page_s']}s")
+if show_metrics:
+    st.sidebar.caption(f"Startup: {timings}")
+
 if input_path:
     logger.info(f"Trying to open: {input_path}")
     st.text(f"Trying to open: {input_path}")
     
     frame = None
     if use_rtsp:
-        frame = fetch_rtsp_frame_ffmpeg(input_path, width=704, height=576)
+        try:
+            width, height, _ = probe_stream(input_path)
+        except Exception as e:
+            logger.warning(f"Could not probe stream resolution, assuming 704x576: {e}")
+            width, height = 704, 576
+        frame = fetch_rtsp_frame_ffmpeg(input_path, width=width, height=height)
     else:
         cap = cv2.VideoCapture(input_path)
         ret, frame = cap.read()
@@ -141,6 +225,8 @@ if input_path:
                 distance = st.number_input("Step 3⃣: Enter real-world distance between lines (in meters):", min_value=1.0)
 
                 show_live = st.checkbox("Show video live during processing", value=True)
+                save_video = st.checkbox("Save annotated video (otherwise only track metadata is written)", value=True)
+                use_motion_gate = st.checkbox("Skip detection on frames without motion in the ROI", value=False)
 
                 if st.button("🚀 Start Processing"):
                     config = {
@@ -158,17 +244,62 @@ if input_path:
                     logger.info(f"Processing started for {config['video_name']} with config: {config_path}")
                     st.success("🎥 Configuration saved. Starting processing...")
 
-                    st_frame = st.empty()
-                    output_path = os.path.join(OUTPUT_DIR, f"processed_{config['video_name']}")
+                    output_mode = "video" if save_video else "sidecar"
+                    # Live streams never repeat, so only uploaded files are looked up in the result cache
+                    key = None
+                    if video_hash:
+                        from models.detector import model_version
+
+                        key = cache_key(video_hash, config, model_version(),
+                                        {"output_mode": output_mode, "motion_gate": use_motion_gate})
+                    cached = result_cache().lookup(key) if key else None
+
+                    if cached:
+                        logger.info(f"Result cache hit for {config['video_name']}, skipping processing")
+                        st.success("♻️ This video was already processed with the same settings. Showing the cached result.")
+                        show_results(cached["files"])
+                    else:
+                        st_frame = st.empty()
+                        st_metrics = st.sidebar.empty()
+                        output_dir = result_cache().entry_dir(key) if key else OUTPUT_DIR
+                        output_path = os.path.join(output_dir, f"processed_{config['video_name']}")
+
+                        from processing.track_video import get_detector, process_video
+                        from processing.sidecar import sidecar_paths
 
-                    for idx, frame in enumerate(process_video(input_path, config_path, output_path)):
-                        if show_live and idx % 5 == 0:
-                            logger.debug(f"Displaying frame {idx}")
-                            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                            st_frame.image(frame_rgb, channels="RGB")
+                        processing_start = time.perf_counter()
+                        frames = process_video(input_path, config_path, output_path, detector=get_detector(),
+                                               output_mode=output_mode,
+                                               display_every=5 if show_live else 0, motion_gate=use_motion_gate)
+                        try:
+                            for idx, frame in enumerate(frames):
+                                if idx == 0:
+                                    timings["first_frame_s"] = round(time.perf_counter() - processing_start, 2)
+                                    logger.info(f"Time to first processed frame: {timings['first_frame_s']}s")
+                                if frame is not None:
+                                    logger.debug("Displaying frame %d", idx, extra=every(1.0))
+                                    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                                    st_frame.image(frame_rgb, channels="RGB")
+                                if show_metrics and idx % 25 == 0:
+                                    st_metrics.json(metrics.snapshot())
+                        except BaseException:
+                            # Includes Streamlit's stop and rerun; a partial result must not be served later
+                            frames.close()
+                            if key:
+                                result_cache().discard(key)
+                            raise
 
-                    logger.info("Processing completed.")
-                    st.success("✅ Processing complete. Check output video and database.")
+                        logger.info("Processing completed.")
+                        st.success("✅ Processing complete. Check output video and database.")
+                        files = {"csv": os.path.join(output_dir, f"speeds_{config['video_name']}.csv")}
+                        if save_video:
+                            files["video"] = output_path
+                        else:
+                            files["sidecar"], files["sidecar_header"] = sidecar_paths(output_path)
+                        if key:
+                            result_cache().store(key, files, {"video_name": config["video_name"],
+                                                              "config": config, "input": input_path})
+                        show_results(files)
             else:
                 st.warning("⚠️ Please draw at least two virtual lines inside the ROI.")
         else:
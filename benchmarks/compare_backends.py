@@ -0,0 +1,107 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+import cv2
+import numpy as np
+from models.detector import BACKENDS, DET_CLS, DET_CONF, DET_FRAME, DET_X1, DET_Y2, create_detector
+from models.tracker import Tracker
+
+REFERENCE_BACKEND = "ultralytics"
+
+def read_frames(video_path, max_frames):
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+def run_backend(backend, frames, model_path, batch_size):
+    detector = create_detector(backend, model_path)
+    detector.warmup()
+    outputs = []
+    start = time.perf_counter()
+    for i in range(0, len(frames), batch_size):
+        detections = detector.detect_batch(frames[i:i + batch_size])
+        detections[:, DET_FRAME] += i
+        outputs.append(detections)
+    elapsed = time.perf_counter() - start
+    return np.concatenate(outputs), elapsed
+
+def average_precision(reference, candidate, iou_threshold=0.5):
+    # AP of candidate detections against the reference backend's detections as ground truth, per class
+    aps = []
+    for cls in np.unique(reference[:, DET_CLS]):
+        ref = reference[reference[:, DET_CLS] == cls]
+        cand = candidate[candidate[:, DET_CLS] == cls]
+        if not len(cand):
+            aps.append(0.0)
+            continue
+        cand = cand[np.argsort(-cand[:, DET_CONF])]
+        matched = set()
+        tp = np.zeros(len(cand))
+        for i, row in enumerate(cand):
+            ref_idx = np.flatnonzero(ref[:, DET_FRAME] == row[DET_FRAME])
+            if not len(ref_idx):
+                continue
+            ious = Tracker.iou_matrix(row[None, DET_X1:DET_Y2 + 1], ref[ref_idx, DET_X1:DET_Y2 + 1])[0]
+            best = int(np.argmax(ious))
+            if ious[best] >= iou_threshold and ref_idx[best] not in matched:
+                matched.add(ref_idx[best])
+                tp[i] = 1
+        recall = np.cumsum(tp) / len(ref)
+        precision = np.cumsum(tp) / np.arange(1, len(cand) + 1)
+        # Area under the monotone precision envelope
+        envelope = np.maximum.accumulate(precision[::-1])[::-1]
+        aps.append(float(np.sum(np.diff(np.concatenate(([0.0], recall))) * envelope)))
+    return float(np.mean(aps)) if aps else 1.0
+
+def compare(video_path, backends, model_path="yolo11n.pt", max_frames=300, batch_size=1):
+    frames = read_frames(video_path, max_frames)
+    if not frames:
+        raise ValueError(f"No frames read from {video_path}")
+
+    reference = None
+    results = {}
+    for backend in [REFERENCE_BACKEND] + [b for b in backends if b != REFERENCE_BACKEND]:
+        detections, elapsed = run_backend(backend, frames, model_path, batch_size)
+        if backend == REFERENCE_BACKEND:
+            reference = detections
+        results[backend] = {
+            "fps": round(len(frames) / elapsed, 2) if elapsed > 0 else 0.0,
+            "detections": len(detections),
+            "map50_vs_reference": round(average_precision(reference, detections), 4),
+        }
+    for backend, result in results.items():
+        result["map50_drift"] = round(1.0 - result["map50_vs_reference"], 4)
+        result["speedup"] = round(result["fps"] / results[REFERENCE_BACKEND]["fps"], 2)
+    return {"video": video_path, "frames": len(frames), "batch_size": batch_size, "backends": results}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare detector backends against the PyTorch path on one video.")
+    parser.add_argument("video")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=["onnx", "onnx-int8"])
+    parser.add_argument("--model", default="yolo11n.pt")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--output", default="backend_comparison.json")
+    args = parser.parse_args(argv)
+
+    result = compare(args.video, args.backends, args.model, args.frames, args.batch_size)
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(json.dumps(result, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
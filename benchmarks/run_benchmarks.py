@@ -0,0 +1,197 @@
+import argparse
+import csv
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+import numpy as np
+from benchmarks.stub_detector import StubDetector
+from benchmarks.synthetic import generate
+from processing.motion_gate import MotionGate
+from processing.track_video import VideoSession, iter_numbered_batches, load_config, open_source
+
+STAGES = ("decode", "detect", "track", "estimate", "draw", "encode")
+# Relative slack before a change counts as a regression
+DEFAULT_TOLERANCE = 0.10
+
+class StageTimer:
+    def __init__(self):
+        self.totals = defaultdict(float)
+
+    def add(self, stage, seconds):
+        self.totals[stage] += seconds
+
+    def wrap(self, stage, fn):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.totals[stage] += time.perf_counter() - start
+        return timed
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024, 1)
+
+def speed_errors(log_path, truth, fps):
+    with open(log_path, "r") as f:
+        rows = list(csv.DictReader(f))
+    unmatched = list(truth)
+    errors = []
+    for row in rows:
+        if not unmatched:
+            break
+        # Pair each measurement with the vehicle that crossed line 2 closest to that frame
+        best = min(unmatched, key=lambda v: abs(v["line2_frame"] - int(row["frame"])))
+        if abs(best["line2_frame"] - int(row["frame"])) > fps:
+            continue
+        unmatched.remove(best)
+        errors.append(abs(float(row["speed_kmph"]) - best["speed_kmph"]))
+    return errors, len(rows), len(unmatched)
+
+def run(detector_name="stub", n_frames=500, n_vehicles=12, batch_size=1, work_dir=None, seed=0, motion_gate=False,
+        gate_audit_every=0):
+    work_dir = work_dir or tempfile.mkdtemp(prefix="bench_")
+    video_path, config_path, truth = generate(work_dir, n_frames=n_frames, n_vehicles=n_vehicles, seed=seed)
+
+    load_start = time.perf_counter()
+    if detector_name == "stub":
+        detector = StubDetector()
+    else:
+        from models.detector import create_detector
+        detector = create_detector("ultralytics" if detector_name == "yolo" else detector_name)
+        detector.warmup()
+    detector_load = time.perf_counter() - load_start
+
+    timer = StageTimer()
+    source = open_source(video_path)
+    session = VideoSession(load_config(config_path), os.path.join(work_dir, "bench_out.mp4"), source.fps,
+                           source.width, source.height)
+    session.tracker.update = timer.wrap("track", session.tracker.update)
+    session.tracker.advance = timer.wrap("track", session.tracker.advance)
+    if motion_gate:
+        session.gate = MotionGate(session.roi, source.fps, audit_every=gate_audit_every)
+
+    frames = timer.wrap("decode", lambda it: next(it, None))
+    frame_iter = iter_numbered_batches(source.frames, batch_size, source.fps)
+
+    frame_count = 0
+    start = time.perf_counter()
+    while True:
+        item = frames(frame_iter)
+        if item is None:
+            break
+        metas, batch = item
+
+        t0 = time.perf_counter()
+        frame_detections = session.detect_frames(detector, metas, batch)
+        timer.add("detect", time.perf_counter() - t0)
+
+        for ((frame_num, t), detections), frame in zip(frame_detections, batch):
+            track_before = timer.totals["track"]
+            t0 = time.perf_counter()
+            annotations = session.track(frame_num, detections, t=t)
+            # session.track includes the tracker update; the rest is estimation and bookkeeping
+            timer.add("estimate", time.perf_counter() - t0 - (timer.totals["track"] - track_before))
+
+            t0 = time.perf_counter()
+            frame = session.annotate(frame, annotations)
+            timer.add("draw", time.perf_counter() - t0)
+
+            t0 = time.perf_counter()
+            session.write(frame)
+            timer.add("encode", time.perf_counter() - t0)
+            frame_count += 1
+    elapsed = time.perf_counter() - start
+    source.release()
+    session.close()
+
+    errors, measured, missed = speed_errors(session.log_path, truth, source.fps)
+    return {
+        "detector": detector_name,
+        "frames": frame_count,
+        "vehicles": len(truth),
+        "batch_size": batch_size,
+        "fps": round(frame_count / elapsed, 2) if elapsed > 0 else 0.0,
+        "stage_seconds": {stage: round(timer.totals[stage], 4) for stage in STAGES},
+        "stage_ms_per_frame": {
+            stage: round(timer.totals[stage] / max(frame_count, 1) * 1000, 3) for stage in STAGES
+        },
+        "detector_load_s": round(detector_load, 3),
+        "first_frame_ms": round(session.first_frame_seconds * 1000, 1) if session.first_frame_seconds else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "speed_records": measured,
+        "missed_vehicles": missed,
+        "mean_speed_error_kmph": round(float(np.mean(errors)), 2) if errors else None,
+        "max_speed_error_kmph": round(float(np.max(errors)), 2) if errors else None,
+        "motion_gate": session.gate.report() if session.gate else None,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+    }
+
+def compare(result, baseline, tolerance=DEFAULT_TOLERANCE):
+    regressions = []
+    if result["fps"] < baseline["fps"] * (1 - tolerance):
+        regressions.append(f"fps {result['fps']} < baseline {baseline['fps']}")
+    for stage in STAGES:
+        now, before = result["stage_ms_per_frame"][stage], baseline["stage_ms_per_frame"].get(stage)
+        # Ignore sub-0.05ms stages, they are dominated by timer noise
+        if before and now > 0.05 and now > before * (1 + tolerance):
+            regressions.append(f"{stage} {now} ms/frame > baseline {before} ms/frame")
+    now_err, before_err = result["mean_speed_error_kmph"], baseline.get("mean_speed_error_kmph")
+    if now_err is not None and before_err is not None and now_err > before_err * (1 + tolerance) + 0.1:
+        regressions.append(f"mean speed error {now_err} km/h > baseline {before_err} km/h")
+    if result["missed_vehicles"] > baseline.get("missed_vehicles", 0):
+        regressions.append(f"missed vehicles {result['missed_vehicles']} > baseline {baseline['missed_vehicles']}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-stage pipeline benchmark on synthetic traffic video.")
+    parser.add_argument("--detector", choices=("stub", "yolo", "onnx", "onnx-int8", "openvino", "openvino-int8"),
+                        default="stub")
+    parser.add_argument("--frames", type=int, default=500)
+    parser.add_argument("--vehicles", type=int, default=12)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--baseline", help="Earlier result JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--motion-gate", action="store_true",
+                        help="Run with the motion gate and compare against full detection on the same video")
+    parser.add_argument("--gate-audit-every", type=int, default=25)
+    args = parser.parse_args(argv)
+
+    result = run(args.detector, args.frames, args.vehicles, args.batch_size, seed=args.seed,
+                 motion_gate=args.motion_gate, gate_audit_every=args.gate_audit_every)
+    if args.motion_gate:
+        full = run(args.detector, args.frames, args.vehicles, args.batch_size, seed=args.seed)
+        result["vs_full_detection"] = {
+            "fps": full["fps"],
+            "detect_ms_per_frame": full["stage_ms_per_frame"]["detect"],
+            "speed_records": full["speed_records"],
+            "missed_vehicles": result["missed_vehicles"] - full["missed_vehicles"],
+        }
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(json.dumps(result, indent=2))
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,24 @@
+import cv2
+import numpy as np
+from benchmarks.synthetic import VEHICLE_GRAY
+
+CAR_CLASS_ID = 2
+
+class StubDetector:
+    def __init__(self, min_area=100):
+        self.min_area = min_area
+        self.names = {CAR_CLASS_ID: "car"}
+
+    def detect_batch(self, frames):
+        rows = []
+        for frame_idx, frame in enumerate(frames):
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+            mask = (gray > (VEHICLE_GRAY - 40)).astype(np.uint8)
+            n, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+            for x, y, w, h, area in stats[1:n]:
+                if area >= self.min_area:
+                    rows.append((frame_idx, x, y, x + w, y + h, 1.0, CAR_CLASS_ID))
+        return np.array(rows, dtype=np.float32).reshape(-1, 7)
+
+    def detect(self, image):
+        return [(int(r[1]), int(r[2]), int(r[3]), int(r[4]), "car") for r in self.detect_batch([image])]
@@ -0,0 +1,68 @@
+import json
+import os
+import cv2
+import numpy as np
+
+ROAD_GRAY = 60
+VEHICLE_GRAY = 230
+
+def make_vehicles(n_vehicles, fps, width, seed=0, min_kmph=20.0, max_kmph=90.0):
+    rng = np.random.default_rng(seed)
+    vehicles = []
+    lanes = max(1, width // 80)
+    for i in range(n_vehicles):
+        vehicles.append({
+            "id": i,
+            "lane_x": int(20 + (i % lanes) * 80),
+            "start_frame": int(i * fps * 0.8 + rng.integers(0, int(fps // 2) + 1)),
+            "speed_kmph": round(float(rng.uniform(min_kmph, max_kmph)), 1),
+            "size": (40, 30),
+        })
+    return vehicles
+
+def vehicle_box(vehicle, frame_num, fps, px_per_m):
+    w, h = vehicle["size"]
+    px_per_frame = vehicle["speed_kmph"] / 3.6 * px_per_m / fps
+    cy = -h + (frame_num - vehicle["start_frame"]) * px_per_frame
+    x1 = vehicle["lane_x"]
+    return x1, int(round(cy - h / 2)), x1 + w, int(round(cy + h / 2))
+
+def generate(out_dir, n_frames=500, n_vehicles=12, fps=25.0, width=640, height=480, px_per_m=8.0, seed=0):
+    os.makedirs(out_dir, exist_ok=True)
+    video_path = os.path.join(out_dir, "synthetic.mp4")
+    line1_y, line2_y = int(height * 0.35), int(height * 0.75)
+    vehicles = make_vehicles(n_vehicles, fps, width, seed)
+
+    out = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    for frame_num in range(n_frames):
+        frame = np.full((height, width, 3), ROAD_GRAY, dtype=np.uint8)
+        for vehicle in vehicles:
+            x1, y1, x2, y2 = vehicle_box(vehicle, frame_num, fps, px_per_m)
+            if y2 > 0 and y1 < height:
+                cv2.rectangle(frame, (x1, y1), (x2, y2), (VEHICLE_GRAY,) * 3, -1)
+        out.write(frame)
+    out.release()
+
+    config = {
+        "polygon_roi": [[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]],
+        "line_1": [[0, line1_y], [width - 1, line1_y]],
+        "line_2": [[0, line2_y], [width - 1, line2_y]],
+        "real_world_distance_m": (line2_y - line1_y) / px_per_m,
+        "video_name": "synthetic.mp4",
+    }
+    config_path = os.path.join(out_dir, "synthetic_config.json")
+    with open(config_path, "w") as f:
+        json.dump(config, f, indent=2)
+
+    truth = []
+    for vehicle in vehicles:
+        px_per_frame = vehicle["speed_kmph"] / 3.6 * px_per_m / fps
+        # Frame at which the box center first reaches line 2
+        cross_frame = vehicle["start_frame"] + (line2_y + vehicle["size"][1]) / px_per_frame
+        if cross_frame < n_frames:
+            truth.append({"id": vehicle["id"], "speed_kmph": vehicle["speed_kmph"], "line2_frame": cross_frame})
+    truth_path = os.path.join(out_dir, "synthetic_truth.json")
+    with open(truth_path, "w") as f:
+        json.dump(truth, f, indent=2)
+
+    return video_path, config_path, truth
@@ -5,7 +5,9 @@ ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 INPUT_DIR = os.path.join(ROOT_DIR, "inputs")
 OUTPUT_DIR = os.path.join(ROOT_DIR, "outputs")
 TEMP_DIR = os.path.join(ROOT_DIR, "temp")
+MODEL_CACHE_DIR = os.path.join(ROOT_DIR, "model_cache")
 
 os.makedirs(INPUT_DIR, exist_ok=True)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 os.makedirs(TEMP_DIR, exist_ok=True)
+os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
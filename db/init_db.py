@@ -1,34 +1,30 @@
-import psycopg2
-from dotenv import load_dotenv
+import argparse
 import os
+import sys
 
-load_dotenv()
-NEON_DB_URL = os.getenv("NEON_DB_URL")
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
 
-def create_table_if_not_exists():
-    try:
-        conn = psycopg2.connect(NEON_DB_URL)
-        cursor = conn.cursor()
-
-        cursor.execute(
-            """
-                CREATE TABLE IF NOT EXISTS vehicle_speed_logs (
-                    id SERIAL PRIMARY KEY,
-                    video TEXT,
-                    track_id INTEGER,
-                    speed_kmph FLOAT,
-                    timestamp TIMESTAMPTZ,
-                    frame INTEGER
-                );
-            """
-        )
+from db.queries import NEON_DB_URL, connect
+from db.schema import create_schema, rebuild_rollups
 
-        conn.commit()
-        cursor.close()
+def create_table_if_not_exists(url=NEON_DB_URL, rebuild=False):
+    try:
+        conn, dialect = connect(url)
+        create_schema(conn, dialect)
+        print("Table 'vehicle_speed_logs', its indexes and the rollup tables created or already exist.")
+        if rebuild:
+            minutes = rebuild_rollups(conn, dialect)
+            print(f"Rebuilt rollups from existing rows: {minutes} camera-minutes.")
         conn.close()
-        print("Table 'vehicle_speed_logs' created or already exists.")
     except Exception as e:
         print(f"Error creating table: {e}")
 
 if __name__ == "__main__":
-    create_table_if_not_exists()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Create or migrate the speed log schema.")
+    parser.add_argument("--db", default=NEON_DB_URL, help="Postgres URL or sqlite:///path.db")
+    parser.add_argument("--rebuild-rollups", action="store_true",
+                        help="Backfill camera and event time on old rows and recompute the per-minute rollups")
+    args = parser.parse_args()
+    create_table_if_not_exists(args.db, args.rebuild_rollups)
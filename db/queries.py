@@ -0,0 +1,155 @@
+import argparse
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from dotenv import load_dotenv
+from db.schema import HIST_BIN_KMPH
+
+load_dotenv()
+NEON_DB_URL = os.getenv("NEON_DB_URL")
+
+# Epoch seconds of the rollup minute, for grouping minutes into wider buckets
+MINUTE_EPOCH = {
+    "postgres": "EXTRACT(EPOCH FROM minute)::BIGINT",
+    "sqlite": "CAST(strftime('%s', minute) AS INTEGER)",
+}
+
+def connect(url=NEON_DB_URL):
+    # sqlite:///path/to/file.db (or sqlite://:memory:) for local runs and tests, anything else goes to Postgres
+    if url.startswith("sqlite://"):
+        import sqlite3
+
+        return sqlite3.connect(url[len("sqlite:///"):] if url.startswith("sqlite:///") else ":memory:"), "sqlite"
+    import psycopg2
+
+    return psycopg2.connect(url), "postgres"
+
+def percentile_from_bins(bins, q, max_value=None):
+    # bins is [(bin, vehicles)] sorted by bin; returns the midpoint of the bin holding the q-th vehicle,
+    # capped at max_value so it never exceeds the fastest vehicle actually seen
+    total = sum(count for _, count in bins)
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for bin_, count in bins:
+        seen += count
+        if seen >= rank:
+            break
+    value = (bin_ + 0.5) * HIST_BIN_KMPH
+    if max_value is not None:
+        value = min(value, max_value)
+    return round(value, 1)
+
+class SpeedQueries:
+    def __init__(self, conn, dialect="postgres"):
+        self.conn = conn
+        self.dialect = dialect
+        self.param = "%s" if dialect == "postgres" else "?"
+
+    def _where(self, cameras, start, end, time_column="minute"):
+        clauses, params = [], []
+        if cameras:
+            clauses.append(f"camera IN ({', '.join([self.param] * len(cameras))})")
+            params.extend(cameras)
+        if start is not None:
+            clauses.append(f"{time_column} >= {self.param}")
+            params.append(str(start))
+        if end is not None:
+            clauses.append(f"{time_column} < {self.param}")
+            params.append(str(end))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def _fetch(self, sql, params):
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def cameras(self):
+        return [row[0] for row in self._fetch("SELECT DISTINCT camera FROM vehicle_speed_minutes ORDER BY camera", [])]
+
+    def summary(self, start=None, end=None, cameras=None, bucket_minutes=None):
+        # Per-camera stats over [start, end), split into bucket_minutes-wide buckets when given; reads only rollups
+        where, params = self._where(cameras, start, end)
+        if bucket_minutes:
+            bucket = f"({MINUTE_EPOCH[self.dialect]} / {int(bucket_minutes) * 60})"
+        else:
+            bucket = "0"
+
+        totals = self._fetch(
+            f"""
+                SELECT camera, {bucket} AS bucket, SUM(vehicles), SUM(speed_sum), MAX(max_speed), SUM(over_limit)
+                FROM vehicle_speed_minutes{where}
+                GROUP BY camera, bucket
+                ORDER BY camera, bucket
+            """,
+            params,
+        )
+        bins = {}
+        for camera, bucket_id, bin_, count in self._fetch(
+            f"""
+                SELECT camera, {bucket} AS bucket, bin, SUM(vehicles)
+                FROM vehicle_speed_histogram{where}
+                GROUP BY camera, bucket, bin
+                ORDER BY camera, bucket, bin
+            """,
+            params,
+        ):
+            bins.setdefault((camera, bucket_id), []).append((bin_, count))
+
+        results = []
+        for camera, bucket_id, vehicles, speed_sum, max_speed, over_limit in totals:
+            results.append({
+                "camera": camera,
+                "bucket_start": (datetime.fromtimestamp(int(bucket_id) * int(bucket_minutes) * 60, timezone.utc)
+                                 if bucket_minutes else None),
+                "vehicles": int(vehicles),
+                "mean_kmph": round(speed_sum / vehicles, 1) if vehicles else None,
+                "p85_kmph": percentile_from_bins(bins.get((camera, bucket_id), []), 0.85, max_speed),
+                "max_kmph": max_speed,
+                "over_limit": int(over_limit),
+            })
+        return results
+
+    def vehicles(self, camera, start=None, end=None, limit=1000):
+        # Individual records for one camera, served by the (camera, event_time) index
+        where, params = self._where([camera], start, end, time_column="event_time")
+        rows = self._fetch(
+            f"""
+                SELECT video, camera, track_id, speed_kmph, event_time, frame
+                FROM vehicle_speed_logs{where}
+                ORDER BY event_time
+                LIMIT {int(limit)}
+            """,
+            params,
+        )
+        return [dict(zip(("video", "camera", "track_id", "speed_kmph", "event_time", "frame"), row)) for row in rows]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Speed statistics per camera from the per-minute rollups.")
+    parser.add_argument("--db", default=NEON_DB_URL, help="Postgres URL or sqlite:///path.db")
+    parser.add_argument("--camera", action="append", help="Repeat for several cameras; all cameras by default")
+    parser.add_argument("--start", help="Inclusive start, e.g. '2025-06-05 14:00'")
+    parser.add_argument("--end", help="Exclusive end")
+    parser.add_argument("--bucket", type=int, help="Bucket width in minutes; one row per camera if omitted")
+    args = parser.parse_args(argv)
+
+    conn, dialect = connect(args.db)
+    try:
+        result = SpeedQueries(conn, dialect).summary(args.start, args.end, args.camera, args.bucket)
+    finally:
+        conn.close()
+    print(json.dumps(result, indent=2, default=str))
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,234 @@
+import math
+import os
+from collections import Counter
+from datetime import datetime
+
+SPEED_LIMIT_KMPH = float(os.getenv("SPEED_LIMIT_KMPH", "50"))
+# Speeds are bucketed into 1 km/h bins so p85 over any time range can be computed from the rollups
+HIST_BIN_KMPH = 1.0
+
+LOG_COLUMNS = ("video", "camera", "track_id", "speed_kmph", "timestamp", "event_time", "frame")
+
+POSTGRES_SCHEMA = [
+    """
+        CREATE TABLE IF NOT EXISTS vehicle_speed_logs (
+            id BIGSERIAL PRIMARY KEY,
+            video TEXT,
+            camera TEXT,
+            track_id INTEGER,
+            speed_kmph FLOAT,
+            timestamp TIMESTAMPTZ,
+            event_time TIMESTAMPTZ,
+            frame INTEGER
+        )
+    """,
+    # Tables created before the camera and event time columns existed
+    "ALTER TABLE vehicle_speed_logs ADD COLUMN IF NOT EXISTS camera TEXT",
+    "ALTER TABLE vehicle_speed_logs ADD COLUMN IF NOT EXISTS event_time TIMESTAMPTZ",
+    "CREATE INDEX IF NOT EXISTS vehicle_speed_logs_camera_time_idx ON vehicle_speed_logs (camera, event_time)",
+    # Rows arrive roughly in event time order, so a BRIN index covers time-only scans at a tiny size
+    "CREATE INDEX IF NOT EXISTS vehicle_speed_logs_time_brin ON vehicle_speed_logs USING BRIN (event_time)",
+    """
+        CREATE TABLE IF NOT EXISTS vehicle_speed_minutes (
+            camera TEXT NOT NULL,
+            minute TIMESTAMPTZ NOT NULL,
+            vehicles INTEGER NOT NULL,
+            speed_sum DOUBLE PRECISION NOT NULL,
+            max_speed DOUBLE PRECISION NOT NULL,
+            over_limit INTEGER NOT NULL,
+            PRIMARY KEY (camera, minute)
+        )
+    """,
+    "CREATE INDEX IF NOT EXISTS vehicle_speed_minutes_minute_idx ON vehicle_speed_minutes (minute)",
+    """
+        CREATE TABLE IF NOT EXISTS vehicle_speed_histogram (
+            camera TEXT NOT NULL,
+            minute TIMESTAMPTZ NOT NULL,
+            bin INTEGER NOT NULL,
+            vehicles INTEGER NOT NULL,
+            PRIMARY KEY (camera, minute, bin)
+        )
+    """,
+]
+
+SQLITE_SCHEMA = [
+    """
+        CREATE TABLE IF NOT EXISTS vehicle_speed_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            video TEXT,
+            camera TEXT,
+            track_id INTEGER,
+            speed_kmph REAL,
+            timestamp TEXT,
+            event_time TEXT,
+            frame INTEGER
+        )
+    """,
+    "CREATE INDEX IF NOT EXISTS vehicle_speed_logs_camera_time_idx ON vehicle_speed_logs (camera, event_time)",
+    "CREATE INDEX IF NOT EXISTS vehicle_speed_logs_time_idx ON vehicle_speed_logs (event_time)",
+    """
+        CREATE TABLE IF NOT EXISTS vehicle_speed_minutes (
+            camera TEXT NOT NULL,
+            minute TEXT NOT NULL,
+            vehicles INTEGER NOT NULL,
+            speed_sum REAL NOT NULL,
+            max_speed REAL NOT NULL,
+            over_limit INTEGER NOT NULL,
+            PRIMARY KEY (camera, minute)
+        )
+    """,
+    "CREATE INDEX IF NOT EXISTS vehicle_speed_minutes_minute_idx ON vehicle_speed_minutes (minute)",
+    """
+        CREATE TABLE IF NOT EXISTS vehicle_speed_histogram (
+            camera TEXT NOT NULL,
+            minute TEXT NOT NULL,
+            bin INTEGER NOT NULL,
+            vehicles INTEGER NOT NULL,
+            PRIMARY KEY (camera, minute, bin)
+        )
+    """,
+]
+
+MINUTES_UPSERT = {
+    "postgres": """
+        INSERT INTO vehicle_speed_minutes (camera, minute, vehicles, speed_sum, max_speed, over_limit) VALUES %s
+        ON CONFLICT (camera, minute) DO UPDATE SET
+            vehicles = vehicle_speed_minutes.vehicles + EXCLUDED.vehicles,
+            speed_sum = vehicle_speed_minutes.speed_sum + EXCLUDED.speed_sum,
+            max_speed = GREATEST(vehicle_speed_minutes.max_speed, EXCLUDED.max_speed),
+            over_limit = vehicle_speed_minutes.over_limit + EXCLUDED.over_limit
+    """,
+    "sqlite": """
+        INSERT INTO vehicle_speed_minutes (camera, minute, vehicles, speed_sum, max_speed, over_limit)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (camera, minute) DO UPDATE SET
+            vehicles = vehicle_speed_minutes.vehicles + excluded.vehicles,
+            speed_sum = vehicle_speed_minutes.speed_sum + excluded.speed_sum,
+            max_speed = MAX(vehicle_speed_minutes.max_speed, excluded.max_speed),
+            over_limit = vehicle_speed_minutes.over_limit + excluded.over_limit
+    """,
+}
+
+HISTOGRAM_UPSERT = {
+    "postgres": """
+        INSERT INTO vehicle_speed_histogram (camera, minute, bin, vehicles) VALUES %s
+        ON CONFLICT (camera, minute, bin) DO UPDATE SET
+            vehicles = vehicle_speed_histogram.vehicles + EXCLUDED.vehicles
+    """,
+    "sqlite": """
+        INSERT INTO vehicle_speed_histogram (camera, minute, bin, vehicles) VALUES (?, ?, ?, ?)
+        ON CONFLICT (camera, minute, bin) DO UPDATE SET
+            vehicles = vehicle_speed_histogram.vehicles + excluded.vehicles
+    """,
+}
+
+# Same truncation and binning as minute_of and speed_bin, done inside the database
+MINUTE_EXPR = {
+    "postgres": "date_trunc('minute', event_time)",
+    "sqlite": "substr(event_time, 1, 16) || ':00'",
+}
+BIN_EXPR = {
+    "postgres": f"FLOOR(speed_kmph / {HIST_BIN_KMPH})::INTEGER",
+    "sqlite": f"CAST(speed_kmph / {HIST_BIN_KMPH} AS INTEGER)",
+}
+
+def create_schema(conn, dialect):
+    cursor = conn.cursor()
+    if dialect == "sqlite":
+        # SQLite has no ADD COLUMN IF NOT EXISTS; add what a database from before these columns is missing
+        cursor.execute(SQLITE_SCHEMA[0])
+        existing = {row[1] for row in cursor.execute("PRAGMA table_info(vehicle_speed_logs)")}
+        for column in ("camera", "event_time"):
+            if column not in existing:
+                cursor.execute(f"ALTER TABLE vehicle_speed_logs ADD COLUMN {column} TEXT")
+        statements = SQLITE_SCHEMA[1:]
+    else:
+        statements = POSTGRES_SCHEMA
+    for statement in statements:
+        cursor.execute(statement)
+    cursor.close()
+    conn.commit()
+
+def row_values(row):
+    # Rows written before camera and event time were recorded fall back to the video name and processing time
+    return (
+        row["video"],
+        row.get("camera") or row["video"],
+        int(row["track_id"]),
+        float(row["speed_kmph"]),
+        row["timestamp"],
+        row.get("event_time") or row["timestamp"],
+        int(row["frame"]),
+    )
+
+def minute_of(event_time):
+    if not isinstance(event_time, datetime):
+        event_time = datetime.fromisoformat(str(event_time))
+    return str(event_time.replace(second=0, microsecond=0))
+
+def speed_bin(speed):
+    return int(math.floor(speed / HIST_BIN_KMPH))
+
+def rollup(rows, speed_limit=SPEED_LIMIT_KMPH):
+    # Collapses a batch to one row per (camera, minute) and (camera, minute, bin) so each key is upserted once
+    minutes = {}
+    bins = Counter()
+    for row in rows:
+        _, camera, _, speed, _, event_time, _ = row_values(row)
+        minute = minute_of(event_time)
+        stats = minutes.setdefault((camera, minute), [0, 0.0, speed, 0])
+        stats[0] += 1
+        stats[1] += speed
+        stats[2] = max(stats[2], speed)
+        stats[3] += speed > speed_limit
+        bins[(camera, minute, speed_bin(speed))] += 1
+    return ([key + tuple(stats) for key, stats in minutes.items()],
+            [key + (count,) for key, count in bins.items()])
+
+def write_rows(cursor, rows, dialect, speed_limit=SPEED_LIMIT_KMPH):
+    # Raw rows and their rollups go in the same transaction, so the two never disagree
+    minutes, bins = rollup(rows, speed_limit)
+    insert = f"INSERT INTO vehicle_speed_logs ({', '.join(LOG_COLUMNS)}) VALUES "
+    if dialect == "postgres":
+        from psycopg2.extras import execute_values
+
+        execute_values(cursor, insert + "%s", [row_values(row) for row in rows])
+        execute_values(cursor, MINUTES_UPSERT[dialect], minutes)
+        execute_values(cursor, HISTOGRAM_UPSERT[dialect], bins)
+    else:
+        cursor.executemany(insert + f"({', '.join('?' * len(LOG_COLUMNS))})", [row_values(row) for row in rows])
+        cursor.executemany(MINUTES_UPSERT[dialect], minutes)
+        cursor.executemany(HISTOGRAM_UPSERT[dialect], bins)
+
+def rebuild_rollups(conn, dialect, speed_limit=SPEED_LIMIT_KMPH):
+    # Backfills camera and event time on old rows, then recomputes every rollup from the raw table
+    minute = MINUTE_EXPR[dialect]
+    param = "%s" if dialect == "postgres" else "?"
+    cursor = conn.cursor()
+    cursor.execute("UPDATE vehicle_speed_logs SET camera = video WHERE camera IS NULL")
+    cursor.execute("UPDATE vehicle_speed_logs SET event_time = timestamp WHERE event_time IS NULL")
+    cursor.execute("DELETE FROM vehicle_speed_minutes")
+    cursor.execute("DELETE FROM vehicle_speed_histogram")
+    cursor.execute(
+        f"""
+            INSERT INTO vehicle_speed_minutes (camera, minute, vehicles, speed_sum, max_speed, over_limit)
+            SELECT camera, {minute}, COUNT(*), SUM(speed_kmph), MAX(speed_kmph),
+                   SUM(CASE WHEN speed_kmph > {param} THEN 1 ELSE 0 END)
+            FROM vehicle_speed_logs
+            GROUP BY camera, {minute}
+        """,
+        (speed_limit,),
+    )
+    cursor.execute(
+        f"""
+            INSERT INTO vehicle_speed_histogram (camera, minute, bin, vehicles)
+            SELECT camera, {minute}, {BIN_EXPR[dialect]}, COUNT(*)
+            FROM vehicle_speed_logs
+            GROUP BY camera, {minute}, {BIN_EXPR[dialect]}
+        """
+    )
+    cursor.execute("SELECT COUNT(*) FROM vehicle_speed_minutes")
+    minutes = cursor.fetchone()[0]
+    cursor.close()
+    conn.commit()
+    return minutes
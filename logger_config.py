@@ -1,17 +1,140 @@
+import atexit
+import json
 import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
 
-def setup_logger(name="SpeedAnalyzer", log_file="speed_analyzer.log", level=logging.INFO):
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+LOGGER_NAME = "SpeedAnalyzer"
+EVENTS_LOGGER_NAME = "SpeedAnalyzer.events"
+LOG_QUEUE_SIZE = 10000
 
-    handler = logging.FileHandler(log_file)
-    handler.setFormatter(formatter)
+_configured = {}
+_lock = threading.RLock()
 
-    console = logging.StreamHandler()
-    console.setFormatter(formatter)
+def every(seconds):
+    # extra= for per-frame calls: each call site logs at most once per interval
+    return {"rate_limit": seconds}
 
+class RateLimitFilter(logging.Filter):
+    def __init__(self):
+        super().__init__()
+        self.last = {}
+        self.suppressed = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        interval = getattr(record, "rate_limit", None)
+        if not interval:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last.get(key, float("-inf")) < interval:
+                self.suppressed[key] = self.suppressed.get(key, 0) + 1
+                return False
+            self.last[key] = now
+            record.suppressed = self.suppressed.pop(key, 0)
+        return True
+
+class SuppressedCountFormatter(logging.Formatter):
+    def format(self, record):
+        message = super().format(record)
+        if getattr(record, "suppressed", 0):
+            message += f" ({record.suppressed} similar messages suppressed)"
+        return message
+
+class JsonEventFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps({"ts": record.created, "event": record.msg, **getattr(record, "fields", {})}, default=str)
+
+class AsyncHandler(QueueHandler):
+    # Callers only enqueue; a listener thread formats and writes, so slow disks never stall the frame loop
+    def __init__(self, *targets, maxsize=LOG_QUEUE_SIZE):
+        super().__init__(queue.Queue(maxsize))
+        self.targets = targets
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._start()
+        atexit.register(self.close)
+
+    def _start(self):
+        self.pid = os.getpid()
+        self.listener = QueueListener(self.queue, *self.targets, respect_handler_level=True)
+        self.listener.start()
+
+    def prepare(self, record):
+        # Formatting is left to the listener thread; records never leave this process
+        return record
+
+    def enqueue(self, record):
+        if os.getpid() != self.pid:
+            # A forked worker inherits the queue but not the listener thread
+            self.queue = queue.Queue(self.maxsize)
+            self._start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        if self.listener is not None and os.getpid() == self.pid:
+            self.listener.stop()
+            self.listener = None
+            if self.dropped:
+                record = logging.makeLogRecord({"name": LOGGER_NAME, "levelno": logging.WARNING, "levelname": "WARNING",
+                                                "msg": f"Logging queue was full, dropped {self.dropped} records"})
+                for target in self.targets:
+                    target.handle(record)
+            for target in self.targets:
+                target.close()
+        super().close()
+
+def setup_logger(name=LOGGER_NAME, log_file="speed_analyzer.log", level=None):
+    # Every module calls this at import; handlers are only attached the first time
     logger = logging.getLogger(name)
-    logger.setLevel(level)
-    logger.addHandler(handler)
-    logger.addHandler(console)
+    with _lock:
+        if name in _configured:
+            return logger
+        formatter = SuppressedCountFormatter('%(asctime)s - %(levelname)s - %(message)s')
+
+        handler = logging.FileHandler(log_file)
+        handler.setFormatter(formatter)
+
+        console = logging.StreamHandler()
+        console.setFormatter(formatter)
+
+        async_handler = AsyncHandler(handler, console)
+        async_handler.addFilter(RateLimitFilter())
+        logger.setLevel(level or os.getenv("LOG_LEVEL", "INFO").upper())
+        logger.addHandler(async_handler)
+        logger.propagate = False
+        _configured[name] = async_handler
+        setup_event_log()
+    return logger
+
+def setup_event_log(path=None):
+    # Structured events (one JSON object per line) go to EVENT_LOG when set and are dropped otherwise
+    path = path or os.getenv("EVENT_LOG")
+    events = logging.getLogger(EVENTS_LOGGER_NAME)
+    with _lock:
+        if EVENTS_LOGGER_NAME in _configured:
+            return events
+        events.propagate = False
+        if not path:
+            events.setLevel(logging.CRITICAL + 1)
+            return events
+        handler = logging.FileHandler(path)
+        handler.setFormatter(JsonEventFormatter())
+        async_handler = AsyncHandler(handler)
+        events.setLevel(logging.INFO)
+        events.addHandler(async_handler)
+        _configured[EVENTS_LOGGER_NAME] = async_handler
+    return events
 
-    return logger
\ No newline at end of file
+def log_event(event, **fields):
+    events = logging.getLogger(EVENTS_LOGGER_NAME)
+    if events.isEnabledFor(logging.INFO):
+        events.info(event, extra={"fields": fields})
@@ -1,21 +1,109 @@
-from ultralytics import YOLO
-from logger_config import setup_logger
+import hashlib
+import os
+import time
+from abc import ABC, abstractmethod
+from functools import lru_cache
+import numpy as np
+from logger_config import every, setup_logger
 
 logger = setup_logger()
 
-class YOLOv11Detector:
-    def __init__(self, model_path="yolo11n.pt"):
-        self.model = YOLO(model_path)
-    
+VEHICLE_CLASSES = ("car", "bus", "truck")
+
+# Column layout of the arrays returned by detect_batch
+DET_FRAME, DET_X1, DET_Y1, DET_X2, DET_Y2, DET_CONF, DET_CLS = range(7)
+
+BACKENDS = ("ultralytics", "onnx", "onnx-int8", "openvino", "openvino-int8")
+
+def weights_hash(model_path):
+    h = hashlib.sha256()
+    with open(model_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()[:16]
+
+@lru_cache(maxsize=None)
+def model_version(model_path="yolo11n.pt", backend=None):
+    # Identifies which model produced a result; weights not downloaded yet fall back to their name
+    backend = backend or os.getenv("DETECTOR_BACKEND", "ultralytics")
+    weights = weights_hash(model_path) if os.path.exists(model_path) else os.path.basename(model_path)
+    return f"{backend}:{weights}"
+
+def empty_detections():
+    return np.empty((0, 7), dtype=np.float32)
+
+class DetectorBase(ABC):
+    # Backends return detect_batch rows in the DET_* layout, with boxes in the coordinates of the given frames
+    def __init__(self, names, conf=0.3, classes=VEHICLE_CLASSES):
+        self.names = names
+        self.conf = conf
+        # Lookup table indexed by raw class id, built once instead of comparing labels per box
+        self.class_mask = np.zeros(max(self.names) + 1, dtype=bool)
+        for cls_id, label in self.names.items():
+            if label in classes:
+                self.class_mask[cls_id] = True
+
+    @abstractmethod
+    def detect_batch(self, frames):
+        pass
+
+    def warmup(self, size=(640, 640), runs=1):
+        # The first predict call initialises the backend; pay for it before the first real frame
+        frame = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+        start = time.perf_counter()
+        for _ in range(runs):
+            self.detect_batch([frame])
+        elapsed = time.perf_counter() - start
+        logger.info(f"Detector warm-up took {elapsed:.2f}s")
+        return elapsed
+
     def detect(self, image):
-        results = self.model.predict(source=image, save=False, conf=0.3, verbose=False)
+        dets = self.detect_batch([image])
         detections = []
-        for result in results:
-            for box in result.boxes:
-                cls = int(box.cls[0])
-                label = result.names[cls]
-                if label in ["car", "bus", "truck"]:
-                    x1, y1, x2, y2 = map(int, box.xyxy[0])
-                    detections.append((x1, y1, x2, y2, label))
-        logger.debug(f"YOLOv11 detections: {len(detections)} vehicles")
-        return detections
\ No newline at end of file
+        for row in dets:
+            x1, y1, x2, y2 = map(int, row[DET_X1:DET_Y2 + 1])
+            detections.append((x1, y1, x2, y2, self.names[int(row[DET_CLS])]))
+        logger.debug("%s detections: %d vehicles", type(self).__name__, len(detections), extra=every(1.0))
+        return detections
+
+class YOLOv11Detector(DetectorBase):
+    def __init__(self, model_path="yolo11n.pt", conf=0.3, classes=VEHICLE_CLASSES):
+        # Imported here so importing the processing modules does not pull in torch
+        from ultralytics import YOLO
+
+        self.model = YOLO(model_path)
+        super().__init__(self.model.names, conf, classes)
+
+    def detect_batch(self, frames):
+        if len(frames) == 0:
+            return empty_detections()
+
+        results = self.model.predict(source=list(frames), save=False, conf=self.conf, verbose=False)
+        per_frame = []
+        for frame_idx, result in enumerate(results):
+            data = result.boxes.data
+            if len(data) == 0:
+                continue
+            data = data.cpu().numpy()
+            data = data[self.class_mask[data[:, 5].astype(np.int64)]]
+            if len(data) == 0:
+                continue
+            per_frame.append(np.column_stack((np.full(len(data), frame_idx, dtype=np.float32), data[:, :6])))
+
+        detections = np.concatenate(per_frame).astype(np.float32) if per_frame else empty_detections()
+        logger.debug("YOLOv11 batch detections: %d vehicles in %d frames", len(detections), len(frames), extra=every(1.0))
+        return detections
+
+def create_detector(backend=None, model_path="yolo11n.pt", **kwargs):
+    # DETECTOR_BACKEND picks the backend per deployment; "-int8" selects the quantized export
+    backend = backend or os.getenv("DETECTOR_BACKEND", "ultralytics")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown detector backend {backend!r}, expected one of {BACKENDS}")
+    if backend == "ultralytics":
+        return YOLOv11Detector(model_path, **kwargs)
+
+    from models.exported_detector import OnnxDetector, OpenVINODetector
+
+    runtime, _, precision = backend.partition("-")
+    detector_cls = OnnxDetector if runtime == "onnx" else OpenVINODetector
+    return detector_cls(model_path, int8=precision == "int8", **kwargs)
@@ -0,0 +1,216 @@
+import glob
+import importlib.util
+import json
+import os
+import shutil
+from abc import abstractmethod
+import cv2
+import numpy as np
+from config import MODEL_CACHE_DIR
+from models.detector import DetectorBase, VEHICLE_CLASSES, empty_detections, weights_hash
+from logger_config import every, setup_logger
+
+logger = setup_logger()
+
+LETTERBOX_COLOR = 114
+# Offset per class id so one NMS pass never suppresses boxes of different classes
+CLASS_OFFSET = 7680
+MAX_CANDIDATES = 3000
+MAX_DETECTIONS = 300
+
+def export_model(model_path, fmt="onnx", imgsz=640, batch=1, int8=False, cache_dir=MODEL_CACHE_DIR,
+                 calibration_data=None):
+    # Exports are static-shape and cached by weights hash, so each variant is built once per weights file
+    if not os.path.exists(model_path):
+        from ultralytics import YOLO
+
+        # Known model names are downloaded on first use
+        model_path = YOLO(model_path).ckpt_path
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    key = f"{stem}-{weights_hash(model_path)}-{fmt}-{imgsz}-b{batch}-{'int8' if int8 else 'fp32'}"
+    target = os.path.join(cache_dir, key + (".onnx" if fmt == "onnx" else "_openvino_model"))
+    meta_path = os.path.join(cache_dir, key + ".json")
+    if os.path.exists(target) and os.path.exists(meta_path):
+        with open(meta_path, "r") as f:
+            return target, json.load(f)
+
+    from ultralytics import YOLO
+
+    logger.info(f"Exporting {model_path} to {fmt} ({'int8' if int8 else 'fp32'}, {imgsz}px, batch {batch})")
+    model = YOLO(model_path)
+    if fmt == "onnx":
+        exported = model.export(format="onnx", imgsz=imgsz, batch=batch, dynamic=False)
+        if int8:
+            # Dynamic quantization needs no calibration set; weights are int8, activations quantized at run time
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            quantize_dynamic(exported, target, weight_type=QuantType.QUInt8)
+            os.remove(exported)
+        else:
+            shutil.move(exported, target)
+    elif fmt == "openvino":
+        options = {"int8": True, "data": calibration_data or "coco8.yaml"} if int8 else {}
+        exported = model.export(format="openvino", imgsz=imgsz, batch=batch, dynamic=False, **options)
+        shutil.rmtree(target, ignore_errors=True)
+        shutil.move(exported, target)
+    else:
+        raise ValueError(f"Unsupported export format {fmt!r}")
+
+    meta = {"names": model.names, "imgsz": imgsz, "batch": batch, "int8": int8, "source": model_path}
+    with open(meta_path, "w") as f:
+        json.dump(meta, f, indent=2)
+    logger.info(f"Cached {fmt} export at {target}")
+    return target, json.loads(json.dumps(meta))
+
+def letterbox(frame, size):
+    h, w = frame.shape[:2]
+    r = min(size / h, size / w)
+    new_w, new_h = int(round(w * r)), int(round(h * r))
+    dw, dh = (size - new_w) / 2, (size - new_h) / 2
+    if (new_w, new_h) != (w, h):
+        frame = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top, left = int(round(dh - 0.1)), int(round(dw - 0.1))
+    canvas = np.full((size, size, 3), LETTERBOX_COLOR, dtype=np.uint8)
+    canvas[top:top + new_h, left:left + new_w] = frame
+    return canvas, r, left, top
+
+def preprocess(frames, size, batch):
+    blob = np.zeros((batch, 3, size, size), dtype=np.float32)
+    transforms = []
+    for i, frame in enumerate(frames):
+        canvas, r, left, top = letterbox(frame, size)
+        # BGR HWC uint8 -> RGB CHW float in [0, 1]
+        blob[i] = canvas[..., ::-1].transpose(2, 0, 1) / 255.0
+        transforms.append((r, left, top, frame.shape[1], frame.shape[0]))
+    return blob, transforms
+
+def nms(boxes, scores, iou_threshold):
+    order = np.argsort(-scores)
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        xx1 = np.maximum(boxes[i, 0], boxes[rest, 0])
+        yy1 = np.maximum(boxes[i, 1], boxes[rest, 1])
+        xx2 = np.minimum(boxes[i, 2], boxes[rest, 2])
+        yy2 = np.minimum(boxes[i, 3], boxes[rest, 3])
+        inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+def postprocess(output, transforms, conf, class_mask, iou_threshold):
+    # YOLOv11 head output is (batch, 4 + classes, anchors) with cx, cy, w, h in letterboxed pixels
+    per_frame = []
+    for frame_idx, (pred, (r, left, top, w, h)) in enumerate(zip(output, transforms)):
+        pred = pred.T
+        scores_all = pred[:, 4:]
+        cls = scores_all.argmax(axis=1)
+        scores = scores_all[np.arange(len(cls)), cls]
+        keep = (scores > conf) & class_mask[cls]
+        if not keep.any():
+            continue
+        pred, cls, scores = pred[keep], cls[keep], scores[keep]
+        if len(scores) > MAX_CANDIDATES:
+            top_idx = np.argpartition(-scores, MAX_CANDIDATES)[:MAX_CANDIDATES]
+            pred, cls, scores = pred[top_idx], cls[top_idx], scores[top_idx]
+
+        boxes = np.empty((len(pred), 4), dtype=np.float32)
+        boxes[:, 0] = pred[:, 0] - pred[:, 2] / 2
+        boxes[:, 1] = pred[:, 1] - pred[:, 3] / 2
+        boxes[:, 2] = pred[:, 0] + pred[:, 2] / 2
+        boxes[:, 3] = pred[:, 1] + pred[:, 3] / 2
+        kept = nms(boxes + cls[:, None] * CLASS_OFFSET, scores, iou_threshold)[:MAX_DETECTIONS]
+        boxes, cls, scores = boxes[kept], cls[kept], scores[kept]
+
+        boxes -= np.array([left, top, left, top], dtype=np.float32)
+        boxes /= r
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, w)
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, h)
+        per_frame.append(np.column_stack((np.full(len(boxes), frame_idx), boxes, scores, cls)))
+    return np.concatenate(per_frame).astype(np.float32) if per_frame else empty_detections()
+
+class ExportedDetector(DetectorBase):
+    fmt = None
+    # Optional dependency that runs the export; checked before the (slow) export is built
+    runtime = None
+
+    def __init__(self, model_path="yolo11n.pt", conf=0.3, classes=VEHICLE_CLASSES, imgsz=640, batch=1, int8=False,
+                 iou=0.7, cache_dir=MODEL_CACHE_DIR, calibration_data=None):
+        if importlib.util.find_spec(self.runtime) is None:
+            raise ImportError(f"DETECTOR_BACKEND={self.fmt} needs {self.runtime}: pip install {self.runtime}")
+        path, meta = export_model(model_path, self.fmt, imgsz, batch, int8, cache_dir, calibration_data)
+        super().__init__({int(k): v for k, v in meta["names"].items()}, conf, classes)
+        self.imgsz = meta["imgsz"]
+        self.batch = meta["batch"]
+        self.iou = iou
+        self._load(path)
+        logger.info(f"{type(self).__name__} ready: {path}")
+
+    @abstractmethod
+    def _load(self, path):
+        pass
+
+    @abstractmethod
+    def _infer(self, blob):
+        pass
+
+    def detect_batch(self, frames):
+        if len(frames) == 0:
+            return empty_detections()
+
+        # The export has a static batch size; the last chunk is zero-padded
+        chunks = []
+        for start in range(0, len(frames), self.batch):
+            chunk = frames[start:start + self.batch]
+            blob, transforms = preprocess(chunk, self.imgsz, self.batch)
+            detections = postprocess(self._infer(blob)[:len(chunk)], transforms, self.conf, self.class_mask, self.iou)
+            detections[:, 0] += start
+            chunks.append(detections)
+        detections = np.concatenate(chunks)
+        logger.debug("%s batch detections: %d vehicles in %d frames", type(self).__name__, len(detections), len(frames),
+                     extra=every(1.0))
+        return detections
+
+class OnnxDetector(ExportedDetector):
+    fmt = "onnx"
+    runtime = "onnxruntime"
+
+    def __init__(self, model_path="yolo11n.pt", providers=("CPUExecutionProvider",), threads=None, **kwargs):
+        self.providers = list(providers)
+        self.threads = threads
+        super().__init__(model_path, **kwargs)
+
+    def _load(self, path):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+        self.session = ort.InferenceSession(path, options, providers=self.providers)
+        self.input_name = self.session.get_inputs()[0].name
+
+    def _infer(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+class OpenVINODetector(ExportedDetector):
+    fmt = "openvino"
+    runtime = "openvino"
+
+    def __init__(self, model_path="yolo11n.pt", device="CPU", **kwargs):
+        self.device = device
+        super().__init__(model_path, **kwargs)
+
+    def _load(self, path):
+        import openvino as ov
+
+        xml = glob.glob(os.path.join(path, "*.xml"))[0]
+        core = ov.Core()
+        self.compiled = core.compile_model(core.read_model(xml), self.device, {"PERFORMANCE_HINT": "LATENCY"})
+        self.output = self.compiled.output(0)
+
+    def _infer(self, blob):
+        return self.compiled([blob])[self.output]
@@ -1,23 +1,67 @@
 from logger_config import setup_logger
 logger = setup_logger()
 
+def segment_crossing(p0, p1, line):
+    # Fraction s in (0, 1] along p0 -> p1 where the motion crosses the line segment, or None
+    (ax, ay), (bx, by) = line
+    dx, dy = p1[0] - p0[0], p1[1] - p0[1]
+    ex, ey = bx - ax, by - ay
+    denom = dx * ey - dy * ex
+    if abs(denom) < 1e-9:
+        return None
+    wx, wy = ax - p0[0], ay - p0[1]
+    s = (wx * ey - wy * ex) / denom
+    u = (wx * dy - wy * dx) / denom
+    if 0.0 < s <= 1.0 and 0.0 <= u <= 1.0:
+        return s
+    return None
+
 class SpeedEstimator:
     def __init__(self, real_distance_m: float):
         self.real_distance = real_distance_m
         self.cross_times = {}
+        self.gap_t = None
 
-    def update_and_get_speed(self, track_id, y_c, t, line1, line2):
+    def mark_gap(self, t):
+        # Observations at or before t are cut off from later ones by a stream reconnect
+        self.gap_t = t if self.gap_t is None else max(self.gap_t, t)
+
+    def update_and_get_speed(self, track_id, point, t, line1, line2, t_uncertainty=0.0):
         rec = self.cross_times.setdefault(track_id, {})
+        prev = rec.get('prev')
+        if prev is not None and 't2' not in rec and self.gap_t is not None and prev[2] <= self.gap_t < t:
+            # Neither crossing times nor the interpolation may span the gap
+            rec.clear()
+            prev = None
+        rec['prev'] = (point[0], point[1], t)
+        if prev is None or 't2' in rec:
+            return None
+
+        p0, t0 = prev[:2], prev[2]
+        for line_idx, line in enumerate((line1, line2)):
+            if rec.get('first_line') == line_idx:
+                continue
+            s = segment_crossing(p0, point, line)
+            if s is None:
+                continue
 
-        if 't1' not in rec and y_c >= line1:
-            rec['t1'] = t
+            # Interpolate between the two observations instead of snapping to the later frame
+            t_cross = t0 + s * (t - t0)
+            rec.setdefault('lines', {})[line_idx] = t_cross
+            if 't1' not in rec:
+                rec['t1'] = t_cross
+                rec['u1'] = t_uncertainty
+                rec['first_line'] = line_idx
+                logger.debug("Track ID %s crossed line %d at %.3fs", track_id, line_idx + 1, t_cross)
+                continue
 
-        if 't1' in rec and 't2' not in rec and y_c >= line2:
-            rec['t2'] = t
+            rec['t2'] = t_cross
             dt = rec['t2'] - rec['t1']
             if dt > 0:
                 speed = round(self.real_distance / dt * 3.6, 1)
-                logger.info(f"Speed calculated for track_id {track_id}: {speed} km/h")
+                # Worst-case error from the timing uncertainty of both crossings
+                rec['error_kmph'] = round(speed * (rec['u1'] + t_uncertainty) / dt, 2)
+                logger.info("Speed calculated for track_id %s: %s km/h", track_id, speed)
                 return speed
 
         return None
@@ -1,63 +1,180 @@
-from filterpy.kalman import KalmanFilter
+from scipy.optimize import linear_sum_assignment
 import numpy as np
 
+# Constant-velocity model over [cx, cy, area, aspect, vcx, vcy, varea], measured as [cx, cy, area, aspect]
+DIM_X, DIM_Z = 7, 4
+
+F = np.eye(DIM_X)
+F[0, 4] = F[1, 5] = F[2, 6] = 1.0
+H = np.eye(DIM_Z, DIM_X)
+Q = np.diag([1.0, 1.0, 1.0, 1.0, 0.01, 0.01, 0.0001])
+R = np.diag([1.0, 1.0, 10.0, 10.0])
+P0 = np.diag([10.0, 10.0, 10.0, 10.0, 10000.0, 10000.0, 10000.0])
+
+def bbox_to_z(boxes):
+    boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+    w = boxes[:, 2] - boxes[:, 0]
+    h = boxes[:, 3] - boxes[:, 1]
+    return np.column_stack((boxes[:, 0] + w / 2, boxes[:, 1] + h / 2, w * h, w / np.maximum(h, 1e-6)))
+
+def x_to_bbox(x):
+    w = np.sqrt(np.clip(x[:, 2] * x[:, 3], 0, None))
+    h = np.divide(x[:, 2], w, out=np.zeros_like(w), where=w > 0)
+    return np.column_stack((x[:, 0] - w / 2, x[:, 1] - h / 2, x[:, 0] + w / 2, x[:, 1] + h / 2))
+
 class Track:
+    __slots__ = ("track_id", "hits", "no_losses", "age", "box", "speed")
+
     def __init__(self, bbox, track_id):
-        self.kf = KalmanFilter(dim_x=7, dim_z=4)
-        self.kf.x[:4] = np.reshape(bbox, (4, 1))
         self.track_id = track_id
         self.hits = 0
         self.no_losses = 0
-        self.box = bbox
+        self.age = 0
+        self.box = np.asarray(bbox, dtype=float)
         self.speed = None
-    
-    def predict(self):
-        self.kf.predict()
-        self.box = self.kf.x[:4].reshape(-1)
-        return self.box
-
-    def update(self, bbox):
-        self.kf.update(np.reshape(bbox, (4, 1)))
-        self.box = bbox
-        self.hits += 1
-        self.no_losses = 0
 
 class Tracker:
-    def __init__(self):
+    def __init__(self, iou_threshold=0.3, max_age=5):
         self.tracks = []
         self.track_id = 0
-    
+        self.retired_ids = []
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        # Row i of x and P is the filter state of tracks[i]
+        self.x = np.empty((0, DIM_X))
+        self.P = np.empty((0, DIM_X, DIM_X))
+
+    def predict(self):
+        if not self.tracks:
+            return np.empty((0, 4))
+
+        # Keep the predicted area non-negative
+        shrinking = self.x[:, 2] + self.x[:, 6] <= 0
+        self.x[shrinking, 6] = 0.0
+
+        self.x = self.x @ F.T
+        self.P = F @ self.P @ F.T + Q
+
+        boxes = x_to_bbox(self.x)
+        for track, box in zip(self.tracks, boxes):
+            track.box = box
+            track.age += 1
+        return boxes
+
+    def advance(self):
+        # Coast tracks through a frame without detections; skipped frames do not count as misses
+        self.predict()
+        return [track for track in self.tracks if track.no_losses == 0]
+
+    def correct(self, indices, boxes):
+        if len(indices) == 0:
+            return
+
+        idx = np.asarray(indices)
+        x, P = self.x[idx], self.P[idx]
+
+        y = bbox_to_z(boxes) - x @ H.T
+        S = P[:, :DIM_Z, :DIM_Z] + R
+        K = P[:, :, :DIM_Z] @ np.linalg.inv(S)
+
+        self.x[idx] = x + (K @ y[:, :, None])[:, :, 0]
+        self.P[idx] = P - K @ P[:, :DIM_Z, :]
+
     def update(self, detections):
-        updated_tracks = []
-
-        for det in detections:
-            matched = False
-            for track in self.tracks:
-                iou_score = self.iou(track.box, det)
-                if iou_score > 0.3:
-                    track.update(det)
-                    updated_tracks.append(track)
-                    matched = True
-                    break
-            
-            if not matched:
-                new_track = Track(det, self.track_id)
-                self.track_id += 1
-                updated_tracks.append(new_track)
-        
-        self.tracks = updated_tracks
-        return self.tracks
-    
+        detections = np.asarray(detections, dtype=float).reshape(-1, 4)
+
+        predicted = self.predict()
+        matches, unmatched_tracks, unmatched_dets = self.associate(predicted, detections)
+
+        if matches:
+            t_idx, d_idx = map(np.asarray, zip(*matches))
+            self.correct(t_idx, detections[d_idx])
+            for t, d in zip(t_idx, d_idx):
+                track = self.tracks[t]
+                track.box = detections[d]
+                track.hits += 1
+                track.no_losses = 0
+
+        for t in unmatched_tracks:
+            self.tracks[t].no_losses += 1
+
+        self.spawn(detections[unmatched_dets])
+        self.prune()
+        return [track for track in self.tracks if track.no_losses == 0]
+
+    def spawn(self, boxes):
+        if len(boxes) == 0:
+            return
+
+        x = np.zeros((len(boxes), DIM_X))
+        x[:, :DIM_Z] = bbox_to_z(boxes)
+        self.x = np.concatenate((self.x, x))
+        self.P = np.concatenate((self.P, np.repeat(P0[None], len(boxes), axis=0)))
+
+        for box in boxes:
+            self.tracks.append(Track(box, self.track_id))
+            self.track_id += 1
+
+    def prune(self):
+        keep = np.array([track.no_losses <= self.max_age for track in self.tracks], dtype=bool)
+        if keep.all():
+            return
+        self.x, self.P = self.x[keep], self.P[keep]
+        self.retired_ids.extend(track.track_id for track, k in zip(self.tracks, keep) if not k)
+        self.tracks = [track for track, k in zip(self.tracks, keep) if k]
+
+    def pop_retired(self):
+        retired, self.retired_ids = self.retired_ids, []
+        return retired
+
+    def snapshot(self):
+        return {
+            "x": self.x.copy(),
+            "P": self.P.copy(),
+            "track_ids": np.array([t.track_id for t in self.tracks], dtype=np.int64),
+            "hits": np.array([t.hits for t in self.tracks], dtype=np.int64),
+            "no_losses": np.array([t.no_losses for t in self.tracks], dtype=np.int64),
+            "age": np.array([t.age for t in self.tracks], dtype=np.int64),
+            "boxes": np.array([t.box for t in self.tracks], dtype=float).reshape(-1, 4),
+            "next_id": self.track_id,
+        }
+
+    def restore(self, state):
+        self.x = np.array(state["x"], dtype=float).reshape(-1, DIM_X)
+        self.P = np.array(state["P"], dtype=float).reshape(-1, DIM_X, DIM_X)
+        self.track_id = int(state["next_id"])
+        self.tracks = []
+        for i, track_id in enumerate(state["track_ids"]):
+            track = Track(state["boxes"][i], int(track_id))
+            track.hits = int(state["hits"][i])
+            track.no_losses = int(state["no_losses"][i])
+            track.age = int(state["age"][i])
+            self.tracks.append(track)
+
+    def associate(self, track_boxes, detections):
+        if len(track_boxes) == 0 or len(detections) == 0:
+            return [], list(range(len(track_boxes))), list(range(len(detections)))
+
+        iou = self.iou_matrix(track_boxes, detections)
+        rows, cols = linear_sum_assignment(-iou)
+        keep = iou[rows, cols] > self.iou_threshold
+        rows, cols = rows[keep], cols[keep]
+
+        unmatched_tracks = np.setdiff1d(np.arange(len(track_boxes)), rows)
+        unmatched_dets = np.setdiff1d(np.arange(len(detections)), cols)
+        return list(zip(rows, cols)), unmatched_tracks.tolist(), unmatched_dets.tolist()
+
     @staticmethod
-    def iou(box1, box2):
-        x1, y1, x2, y2 = box1
-        x1_p, y1_p, x2_p, y2_p = box2
+    def iou_matrix(boxes1, boxes2):
+        b1 = np.asarray(boxes1, dtype=float)[:, None, :]
+        b2 = np.asarray(boxes2, dtype=float)[None, :, :]
 
-        xi1, yi1 = max(x1, x1_p), max(y1, y1_p)
-        xi2, yi2 = min(x2, x2_p), min(y2, y2_p)
+        inter_w = np.clip(np.minimum(b1[..., 2], b2[..., 2]) - np.maximum(b1[..., 0], b2[..., 0]), 0, None)
+        inter_h = np.clip(np.minimum(b1[..., 3], b2[..., 3]) - np.maximum(b1[..., 1], b2[..., 1]), 0, None)
+        inter_area = inter_w * inter_h
 
-        inter_area = max(0, xi2 - xi1) * max(0, yi2 - yi1)
-        box1_area = (x2 - x1) * (y2 - y1)
-        box2_area = (x2_p - x1_p) * (y2_p - y1_p)
+        area1 = (b1[..., 2] - b1[..., 0]) * (b1[..., 3] - b1[..., 1])
+        area2 = (b2[..., 2] - b2[..., 0]) * (b2[..., 3] - b2[..., 1])
+        union = area1 + area2 - inter_area
 
-        return inter_area / float(box1_area + box2_area - inter_area)
\ No newline at end of file
+        return np.divide(inter_area, union, out=np.zeros_like(inter_area), where=union > 0)
@@ -0,0 +1,81 @@
+import numpy as np
+from logger_config import setup_logger
+
+logger = setup_logger()
+
+def distance_to_segment(points, segment):
+    (x1, y1), (x2, y2) = segment
+    a = np.array([x1, y1], dtype=float)
+    ab = np.array([x2 - x1, y2 - y1], dtype=float)
+    denom = max(float(ab @ ab), 1e-9)
+    proj = np.clip(((points - a) @ ab) / denom, 0.0, 1.0)
+    return np.linalg.norm(points - (a + proj[:, None] * ab), axis=1)
+
+class AdaptiveStride:
+    def __init__(self, fps, lines, max_stride=4, near_line_px=30, busy_tracks=25, min_hits=3):
+        self.fps = fps
+        self.lines = lines
+        self.max_stride = max_stride
+        self.near_line_px = near_line_px
+        self.busy_tracks = busy_tracks
+        self.min_hits = min_hits
+        self.stride = 1
+        self.next_detection = 0
+        self.last_detection = 0
+        self.frames = 0
+        self.detected_frames = 0
+        self.speed_errors = []
+
+    def should_detect(self, frame_num):
+        self.frames += 1
+        if frame_num >= self.next_detection:
+            self.detected_frames += 1
+            self.last_detection = frame_num
+            return True
+        return False
+
+    def t_uncertainty(self, frame_num):
+        # Crossing time is quantized to the detection interval, plus drift of predicted frames
+        return (self.stride + frame_num - self.last_detection) / self.fps
+
+    def observe(self, frame_num, tracker):
+        if frame_num != self.last_detection:
+            return self.stride
+
+        self.stride = self.choose_stride(tracker)
+        self.next_detection = frame_num + self.stride
+        return self.stride
+
+    def choose_stride(self, tracker):
+        if not tracker.tracks:
+            return self.max_stride
+
+        centers = tracker.x[:, :2]
+        velocity = np.linalg.norm(tracker.x[:, 4:6], axis=1)
+        # Any track that could reach a line before the next detection forces per-frame detection
+        reach = self.near_line_px + velocity * self.max_stride
+        for line in self.lines:
+            if np.any(distance_to_segment(centers, line) <= reach):
+                return 1
+
+        stride = self.max_stride
+        if len(tracker.tracks) >= self.busy_tracks:
+            stride = max(1, stride // 2)
+        if any(track.hits < self.min_hits for track in tracker.tracks):
+            stride = min(stride, 2)
+        return stride
+
+    def record_speed_error(self, error_kmph):
+        if error_kmph is not None:
+            self.speed_errors.append(error_kmph)
+
+    def report(self):
+        errors = np.array(self.speed_errors, dtype=float)
+        return {
+            "frames": self.frames,
+            "detected_frames": self.detected_frames,
+            "detection_ratio": round(self.detected_frames / self.frames, 3) if self.frames else 0.0,
+            "speed_records": len(errors),
+            "mean_speed_error_kmph": round(float(errors.mean()), 2) if len(errors) else 0.0,
+            "max_speed_error_kmph": round(float(errors.max()), 2) if len(errors) else 0.0,
+        }
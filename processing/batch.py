@@ -0,0 +1,180 @@
+import argparse
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from config import OUTPUT_DIR
+from logger_config import setup_logger
+
+logger = setup_logger()
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv")
+
+_worker_detector = None
+_worker_options = {}
+
+def job_id_for(video_path, config_path):
+    key = f"{os.path.abspath(video_path)}|{os.path.abspath(config_path)}"
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+def discover_jobs(directory, default_config=None):
+    jobs = []
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(VIDEO_EXTENSIONS):
+            continue
+        video_path = os.path.join(directory, name)
+        config_path = os.path.splitext(video_path)[0] + ".json"
+        if not os.path.exists(config_path):
+            config_path = default_config
+        if not config_path:
+            logger.warning(f"No config for {video_path}, skipping")
+            continue
+        jobs.append({"video": video_path, "config": config_path})
+    return jobs
+
+def read_manifest(manifest_path):
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, "r") as f:
+        if manifest_path.endswith(".csv"):
+            entries = list(csv.DictReader(f))
+        else:
+            entries = json.load(f)
+    return [
+        {"video": os.path.join(base, entry["video"]), "config": os.path.join(base, entry["config"])}
+        for entry in entries
+    ]
+
+class JobLedger:
+    def __init__(self, path):
+        self.path = path
+        self.status = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.status[entry["job_id"]] = entry
+
+    def is_done(self, job_id):
+        return self.status.get(job_id, {}).get("status") == "done"
+
+    def record(self, job_id, status, **fields):
+        entry = {"job_id": job_id, "status": status, "time": time.time(), **fields}
+        self.status[job_id] = entry
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+def _init_worker(options):
+    global _worker_detector, _worker_options
+    from models.detector import create_detector
+    from processing.metrics import metrics
+
+    _worker_options = options
+    if options.get("metrics"):
+        metrics.enable()
+    _worker_detector = create_detector(model_path=options.get("model_path", "yolo11n.pt"))
+
+def _run_job(job, output_dir):
+    from processing.checkpoint import checkpoint_path_for
+    from processing.metrics import metrics
+    from processing.track_video import load_config, process_video
+
+    config = load_config(job["config"])
+    # Configs without a video name are named after their file; the output is always named after the file,
+    # so jobs sharing a config never write to the same video
+    config.setdefault("video_name", os.path.basename(job["video"]))
+    output_path = os.path.join(output_dir, f"processed_{os.path.basename(job['video'])}")
+
+    # A job that was started but never finished continues from its checkpoint
+    checkpoint_path = checkpoint_path_for(output_path) if _worker_options.get("checkpoints") else None
+
+    start = time.perf_counter()
+    frames = 0
+    for _ in process_video(job["video"], config, output_path, detector=_worker_detector, display_every=0,
+                           checkpoint_path=checkpoint_path, **_worker_options.get("process_kwargs", {})):
+        frames += 1
+    elapsed = time.perf_counter() - start
+    result = {"frames": frames, "seconds": round(elapsed, 2), "output": output_path}
+    if metrics.enabled:
+        # Workers are separate processes; their stage timings reach the ledger with the job result
+        result["metrics"] = metrics.snapshot()
+    return result
+
+def run_batch(jobs, output_dir=OUTPUT_DIR, workers=2, ledger_path=None, model_path="yolo11n.pt", process_kwargs=None,
+              checkpoints=False, collect_metrics=False):
+    os.makedirs(output_dir, exist_ok=True)
+    ledger = JobLedger(ledger_path or os.path.join(output_dir, "batch_ledger.jsonl"))
+    options = {"model_path": model_path, "process_kwargs": process_kwargs or {}, "checkpoints": checkpoints,
+               "metrics": collect_metrics}
+
+    pending = []
+    skipped = 0
+    for job in jobs:
+        job["job_id"] = job_id_for(job["video"], job["config"])
+        if ledger.is_done(job["job_id"]):
+            skipped += 1
+        else:
+            pending.append(job)
+    logger.info(f"Batch: {len(pending)} jobs to run, {skipped} already done")
+
+    summary = {"done": 0, "failed": 0, "skipped": skipped, "frames": 0}
+    start = time.perf_counter()
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker, initargs=(options,)) as pool:
+        futures = {}
+        for job in pending:
+            ledger.record(job["job_id"], "started", video=job["video"], config=job["config"])
+            futures[pool.submit(_run_job, job, output_dir)] = job
+
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                summary["failed"] += 1
+                ledger.record(job["job_id"], "failed", video=job["video"], error=str(e))
+                logger.error(f"[{summary['done'] + summary['failed']}/{len(pending)}] Failed {job['video']}: {e}")
+                continue
+            summary["done"] += 1
+            summary["frames"] += result["frames"]
+            ledger.record(job["job_id"], "done", video=job["video"], **result)
+            logger.info(f"[{summary['done'] + summary['failed']}/{len(pending)}] Done {job['video']}: "
+                        f"{result['frames']} frames in {result['seconds']}s")
+
+    elapsed = time.perf_counter() - start
+    summary["seconds"] = round(elapsed, 2)
+    summary["fps"] = round(summary["frames"] / elapsed, 2) if elapsed > 0 else 0.0
+    logger.info(f"Batch summary: {summary}")
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Process recorded videos without the Streamlit UI.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--dir", help="Directory of videos, each with a same-named .json config")
+    source.add_argument("--manifest", help="JSON or CSV list of {video, config} pairs")
+    parser.add_argument("--config", help="Config used for videos in --dir that have no own config")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--ledger", help="Job ledger path, reused to resume an interrupted batch")
+    parser.add_argument("--model", default="yolo11n.pt")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--output-mode", choices=("video", "sidecar", "both"), default="video",
+                        help="'sidecar' writes track metadata instead of re-encoding; render it later with processing.render")
+    parser.add_argument("--checkpoint", action="store_true",
+                        help="Checkpoint each job so an interrupted video resumes instead of starting over")
+    parser.add_argument("--metrics", action="store_true",
+                        help="Record per-stage timings for each job in the ledger (same as METRICS_ENABLED=1)")
+    args = parser.parse_args(argv)
+
+    jobs = discover_jobs(args.dir, args.config) if args.dir else read_manifest(args.manifest)
+    summary = run_batch(jobs, args.output_dir, args.workers, args.ledger, args.model,
+                        {"batch_size": args.batch_size, "output_mode": args.output_mode}, args.checkpoint,
+                        args.metrics)
+    print(json.dumps(summary, indent=2))
+    return 1 if summary["failed"] else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,69 @@
+import os
+import pickle
+import time
+from logger_config import setup_logger
+
+logger = setup_logger()
+
+CHECKPOINT_VERSION = 1
+
+def checkpoint_path_for(output_path):
+    return os.path.splitext(output_path)[0] + ".ckpt"
+
+def resume_frames(frames, state, live):
+    if live:
+        # A reconnected stream restarts its clock; continue from the checkpoint time plus the downtime
+        offset = state["t"] + max(0.0, time.time() - state["saved_at"])
+        for frame, t in frames:
+            yield frame, None if t is None else t + offset
+        return
+
+    # Seeks land on the keyframe at or before the target; drop frames that were already processed
+    for frame, t in frames:
+        if t is not None and t <= state["t"] + 1e-6:
+            continue
+        yield frame, t
+
+class CheckpointStore:
+    def __init__(self, path, job, interval=30.0):
+        self.path = path
+        self.job = dict(job)
+        self.interval = interval
+        self.last_saved = time.monotonic()
+        self.saves = 0
+
+    def due(self):
+        return time.monotonic() - self.last_saved >= self.interval
+
+    def save(self, state):
+        state = dict(state, job=self.job, version=CHECKPOINT_VERSION, saved_at=time.time())
+        # Write to a temp file and rename, so a crash mid-write keeps the previous checkpoint intact
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.last_saved = time.monotonic()
+        self.saves += 1
+        logger.debug("Checkpoint saved at frame %d (%.2fs) to %s", state["frame_num"], state["t"], self.path)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "rb") as f:
+                state = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            logger.warning(f"Ignoring unreadable checkpoint {self.path}: {e}")
+            return None
+        if state.get("version") != CHECKPOINT_VERSION or state.get("job") != self.job:
+            logger.warning(f"Ignoring checkpoint {self.path}, it belongs to a different job")
+            return None
+        logger.info(f"Resuming {self.job.get('input')} from frame {state['frame_num']} ({state['t']:.2f}s)")
+        return state
+
+    def clear(self):
+        for path in (self.path, self.path + ".tmp"):
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,207 @@
+import bisect
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logger_config import setup_logger
+
+logger = setup_logger()
+
+# Headless runs (batch, scheduler) have no UI toggle; METRICS_ENABLED=1 turns collection on at import
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "").lower() in ("1", "true", "yes")
+METRICS_PORT = os.getenv("METRICS_PORT")
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+FPS_WINDOW_S = 5.0
+
+def escape_label(value):
+    # Prometheus text format: backslash, double quote and newline must be escaped inside label values
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        running = 0
+        for i, c in enumerate(self.counts):
+            running += c
+            if running >= target:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else float("inf")
+        return float("inf")
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class _StageTimer:
+    __slots__ = ("metrics", "stage", "stream", "start")
+
+    def __init__(self, metrics, stage, stream):
+        self.metrics = metrics
+        self.stage = stage
+        self.stream = stream
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start, self.stream)
+        return False
+
+class Metrics:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self._fps_window = {}
+        self.server = None
+
+    def enable(self, port=None, host="127.0.0.1"):
+        self.enabled = True
+        if port and self.server is None:
+            self.server = start_http_server(self, port, host)
+
+    def disable(self):
+        self.enabled = False
+
+    def timer(self, stage, stream=""):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _StageTimer(self, stage, stream)
+
+    def timed_iter(self, stage, iterable, stream=""):
+        if not self.enabled:
+            return iterable
+        return self._timed_iter(stage, iterable, stream)
+
+    def _timed_iter(self, stage, iterable, stream):
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.observe(stage, time.perf_counter() - start, stream)
+            yield item
+
+    def observe(self, stage, seconds, stream=""):
+        if not self.enabled:
+            return
+        with self.lock:
+            hist = self.histograms.get((stage, stream))
+            if hist is None:
+                hist = self.histograms[(stage, stream)] = Histogram()
+            hist.observe(seconds)
+
+    def inc(self, name, value=1, stream=""):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[(name, stream)] = self.counters.get((name, stream), 0) + value
+
+    def set_gauge(self, name, value, stream=""):
+        if not self.enabled:
+            return
+        self.gauges[(name, stream)] = value
+
+    def frame_done(self, stream=""):
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self.lock:
+            self.counters[("frames_processed_total", stream)] = self.counters.get(("frames_processed_total", stream), 0) + 1
+            start, frames = self._fps_window.get(stream, (now, 0))
+            frames += 1
+            if now - start >= FPS_WINDOW_S:
+                self.gauges[("effective_fps", stream)] = round(frames / (now - start), 2)
+                start, frames = now, 0
+            self._fps_window[stream] = (start, frames)
+
+    def snapshot(self):
+        with self.lock:
+            stages = {
+                f"{stage}{'/' + stream if stream else ''}": {
+                    "count": h.count,
+                    "mean_ms": round(h.sum / h.count * 1000, 3) if h.count else 0.0,
+                    "p50_ms": h.quantile(0.5) * 1000,
+                    "p95_ms": h.quantile(0.95) * 1000,
+                }
+                for (stage, stream), h in self.histograms.items()
+            }
+            counters = {f"{n}{'/' + s if s else ''}": v for (n, s), v in self.counters.items()}
+            gauges = {f"{n}{'/' + s if s else ''}": v for (n, s), v in self.gauges.items()}
+        return {"stages": stages, "counters": counters, "gauges": gauges}
+
+    def render_prometheus(self):
+        lines = [
+            "# HELP speed_stage_latency_seconds Per-stage processing latency.",
+            "# TYPE speed_stage_latency_seconds histogram",
+        ]
+        with self.lock:
+            for (stage, stream), h in sorted(self.histograms.items()):
+                labels = f'stage="{escape_label(stage)}",stream="{escape_label(stream)}"'
+                running = 0
+                for bound, count in zip(LATENCY_BUCKETS, h.counts):
+                    running += count
+                    lines.append(f'speed_stage_latency_seconds_bucket{{{labels},le="{bound}"}} {running}')
+                lines.append(f'speed_stage_latency_seconds_bucket{{{labels},le="+Inf"}} {h.count}')
+                lines.append(f"speed_stage_latency_seconds_sum{{{labels}}} {h.sum}")
+                lines.append(f"speed_stage_latency_seconds_count{{{labels}}} {h.count}")
+
+            for name in sorted({n for n, _ in self.counters}):
+                lines.append(f"# TYPE speed_{name} counter")
+                for (n, stream), value in sorted(self.counters.items()):
+                    if n == name:
+                        lines.append(f'speed_{name}{{stream="{escape_label(stream)}"}} {value}')
+
+            for name in sorted({n for n, _ in self.gauges}):
+                lines.append(f"# TYPE speed_{name} gauge")
+                for (n, stream), value in sorted(self.gauges.items()):
+                    if n == name:
+                        lines.append(f'speed_{name}{{stream="{escape_label(stream)}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+def start_http_server(metrics, port, host="127.0.0.1"):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") not in ("", "/metrics"):
+                self.send_error(404)
+                return
+            body = metrics.render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return server
+
+metrics = Metrics(enabled=METRICS_ENABLED)
@@ -0,0 +1,95 @@
+import cv2
+import numpy as np
+from logger_config import setup_logger
+
+logger = setup_logger()
+
+class MotionGate:
+    def __init__(self, roi, fps, scale=0.25, threshold=20, min_area_frac=0.002, entry_band_px=24, hold_seconds=1.0,
+                 audit_every=0):
+        self.roi = roi
+        self.scale = scale
+        self.threshold = threshold
+        self.hold_frames = max(1, int(round(hold_seconds * fps)))
+        self.audit_every = audit_every
+
+        # Everything runs on a downscaled gray crop of the ROI bounding box
+        x1, y1, x2, y2 = roi.crop_rect
+        self.size = (max(1, int((x2 - x1) * scale)), max(1, int((y2 - y1) * scale)))
+        mask = cv2.resize(roi.mask[y1:y2, x1:x2].astype(np.uint8), self.size, interpolation=cv2.INTER_NEAREST)
+        # The band along the ROI boundary is where vehicles enter; motion there reopens the gate at a lower threshold
+        band = max(1, int(round(entry_band_px * scale)))
+        # A zero border makes ROI sides on the frame edge part of the band too
+        inner = cv2.erode(mask, np.ones((2 * band + 1, 2 * band + 1), np.uint8),
+                          borderType=cv2.BORDER_CONSTANT, borderValue=0)
+        self.mask = mask.astype(bool)
+        self.edge = self.mask & ~inner.astype(bool)
+        self.min_pixels = max(4, int(min_area_frac * np.count_nonzero(self.mask)))
+        self.edge_min_pixels = max(2, self.min_pixels // 4)
+
+        self.prev = None
+        self.open_until = -1
+        self.frames = 0
+        self.open_frames = 0
+        self.motion_frames = 0
+        self.entry_triggers = 0
+        self.skipped_since_audit = 0
+        self.audited_frames = 0
+        self.audit_misses = 0
+
+    def motion(self, frame):
+        small = cv2.resize(self.roi.crop(frame), self.size, interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (3, 3), 0)
+        prev, self.prev = self.prev, gray
+        if prev is None:
+            return None
+        return cv2.absdiff(gray, prev) > self.threshold
+
+    def should_detect(self, frame_num, frame):
+        self.frames += 1
+        moving = self.motion(frame)
+        if moving is None:
+            self.open_until = frame_num + self.hold_frames
+        elif np.count_nonzero(moving & self.edge) >= self.edge_min_pixels:
+            self.entry_triggers += 1
+            self.motion_frames += 1
+            self.open_until = frame_num + self.hold_frames
+        elif np.count_nonzero(moving & self.mask) >= self.min_pixels:
+            self.motion_frames += 1
+            self.open_until = frame_num + self.hold_frames
+
+        if frame_num <= self.open_until:
+            self.open_frames += 1
+            return True
+        self.skipped_since_audit += 1
+        return False
+
+    def audit_due(self):
+        # Every audit_every skipped frames, run the detector anyway to measure what the gate misses
+        if not self.audit_every or self.skipped_since_audit < self.audit_every:
+            return False
+        self.skipped_since_audit = 0
+        return True
+
+    def record_audit(self, frame_num, untracked_vehicles):
+        # Vehicles the tracker already holds, moving or parked, are not misses and keep the gate closed
+        self.audited_frames += 1
+        if untracked_vehicles:
+            self.audit_misses += 1
+            self.open_until = frame_num + self.hold_frames
+            logger.debug("Motion gate missed %d vehicle(s) at frame %d", untracked_vehicles, frame_num)
+
+    def report(self):
+        skipped = self.frames - self.open_frames
+        return {
+            "frames": self.frames,
+            "detected_frames": self.open_frames,
+            "skipped_frames": skipped,
+            "skip_ratio": round(skipped / self.frames, 3) if self.frames else 0.0,
+            "motion_frames": self.motion_frames,
+            "entry_triggers": self.entry_triggers,
+            "audited_frames": self.audited_frames,
+            "audit_misses": self.audit_misses,
+            # Share of audited skips where the detector found no vehicle the tracker did not already have
+            "hit_rate": round(1 - self.audit_misses / self.audited_frames, 3) if self.audited_frames else None,
+        }
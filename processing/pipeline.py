@@ -0,0 +1,140 @@
+import queue
+import threading
+from processing.metrics import metrics
+from logger_config import setup_logger
+
+logger = setup_logger()
+
+BACKPRESSURE_POLICIES = ("block", "drop_oldest")
+
+END_OF_STREAM = object()
+
+class _StageError:
+    def __init__(self, stage, exc):
+        self.stage = stage
+        self.exc = exc
+
+class BoundedQueue:
+    def __init__(self, maxsize, policy="block", stop_event=None):
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.policy = policy
+        self.stop_event = stop_event or threading.Event()
+        self.dropped = 0
+
+    def put(self, item, force_block=False):
+        if self.policy == "drop_oldest" and not force_block:
+            while True:
+                try:
+                    self.queue.put_nowait(item)
+                    return True
+                except queue.Full:
+                    try:
+                        self.queue.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self):
+        while True:
+            try:
+                return self.queue.get(timeout=0.1)
+            except queue.Empty:
+                if self.stop_event.is_set():
+                    return END_OF_STREAM
+
+    def qsize(self):
+        return self.queue.qsize()
+
+# Runs a source and a chain of (name, fn) stages on their own threads. fn maps one item to an
+# iterable of output items. The backpressure policy only applies to the queue after the source
+# and to the output queue; queues between stages always block so finished work is never dropped.
+class Pipeline:
+    def __init__(self, source, stages, queue_size=8, backpressure="block", name=""):
+        self.source = source
+        self.name = name
+        self.stages = stages
+        self.stop_event = threading.Event()
+        n_queues = len(stages) + 1
+        self.queues = [
+            BoundedQueue(
+                queue_size,
+                backpressure if i in (0, n_queues - 1) else "block",
+                self.stop_event,
+            )
+            for i in range(n_queues)
+        ]
+        self.threads = []
+
+    def _run_source(self, out_q):
+        try:
+            for item in self.source:
+                if not out_q.put(item):
+                    return
+        except Exception as e:
+            logger.exception("Pipeline source failed")
+            out_q.put(_StageError("source", e), force_block=True)
+            return
+        out_q.put(END_OF_STREAM, force_block=True)
+
+    def _run_stage(self, name, fn, in_q, out_q):
+        while True:
+            item = in_q.get()
+            if item is END_OF_STREAM or isinstance(item, _StageError):
+                out_q.put(item, force_block=True)
+                return
+            try:
+                for result in fn(item):
+                    if not out_q.put(result):
+                        return
+            except Exception as e:
+                logger.exception(f"Pipeline stage '{name}' failed")
+                out_q.put(_StageError(name, e), force_block=True)
+                return
+
+    def queue_depths(self):
+        return [q.qsize() for q in self.queues]
+
+    def dropped(self):
+        return sum(q.dropped for q in self.queues)
+
+    def __iter__(self):
+        self.threads = [threading.Thread(target=self._run_source, args=(self.queues[0],), name="pipeline-source", daemon=True)]
+        for i, (name, fn) in enumerate(self.stages):
+            self.threads.append(threading.Thread(
+                target=self._run_stage,
+                args=(name, fn, self.queues[i], self.queues[i + 1]),
+                name=f"pipeline-{name}",
+                daemon=True,
+            ))
+        for thread in self.threads:
+            thread.start()
+
+        out_q = self.queues[-1]
+        try:
+            while True:
+                item = out_q.get()
+                if item is END_OF_STREAM:
+                    break
+                if isinstance(item, _StageError):
+                    raise RuntimeError(f"Pipeline stage '{item.stage}' failed") from item.exc
+                if metrics.enabled:
+                    for i, depth in enumerate(self.queue_depths()):
+                        metrics.set_gauge(f"queue_depth_{i}", depth, self.name)
+                    metrics.set_gauge("frames_dropped", self.dropped(), self.name)
+                yield item
+        finally:
+            self.stop_event.set()
+            for thread in self.threads:
+                thread.join(timeout=5)
+            if self.dropped():
+                logger.info(f"Pipeline dropped {self.dropped()} items under backpressure")
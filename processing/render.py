@@ -0,0 +1,79 @@
+import argparse
+import cv2
+import numpy as np
+from processing.sidecar import EMPTY_TRACK_ID, read_sidecar
+from processing.track_video import draw_overlay, gen_frames_from_cap
+from logger_config import setup_logger
+
+logger = setup_logger()
+
+def group_frames(records):
+    # Records are appended in frame order; returns (frame times, row offsets) for lookup by timestamp
+    if not len(records):
+        return np.zeros(0), np.zeros(1, dtype=np.int64)
+    starts = np.flatnonzero(np.diff(records["frame"].astype(np.int64))) + 1
+    offsets = np.concatenate(([0], starts, [len(records)]))
+    return records["t"][offsets[:-1]], offsets
+
+def annotations_at(records, times, offsets, t, tolerance):
+    # The latest processed frame at or before t; decimated ingest holds its boxes until the next one
+    idx = np.searchsorted(times, t + tolerance, side="right") - 1
+    if idx < 0:
+        return []
+    rows = records[offsets[idx]:offsets[idx + 1]]
+    annotations = []
+    for row in rows[rows["track_id"] != EMPTY_TRACK_ID]:
+        x1, y1, x2, y2 = (int(v) for v in row["box"])
+        speed = None if np.isnan(row["speed"]) else round(float(row["speed"]), 2)
+        annotations.append((int(row["track_id"]), (x1, y1, x2, y2), speed))
+    return annotations
+
+def iter_rendered(input_path, sidecar_output_path, start=None, end=None):
+    header, records = read_sidecar(sidecar_output_path)
+    times, offsets = group_frames(records)
+    geometry = (header["polygon_roi"], header["line_1"], header["line_2"])
+
+    cap = cv2.VideoCapture(input_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or header["fps"]
+    tolerance = 0.5 / fps
+    if start:
+        cap.set(cv2.CAP_PROP_POS_MSEC, start * 1000.0)
+    try:
+        for frame, t in gen_frames_from_cap(cap):
+            if start and t < start - tolerance:
+                continue
+            if end is not None and t > end + tolerance:
+                break
+            yield t, draw_overlay(frame, annotations_at(records, times, offsets, t, tolerance), *geometry)
+    finally:
+        cap.release()
+
+def render_video(input_path, sidecar_output_path, output_path, start=None, end=None):
+    cap = cv2.VideoCapture(input_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    cap.release()
+
+    out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+    frames = 0
+    try:
+        for _, frame in iter_rendered(input_path, sidecar_output_path, start, end):
+            out.write(frame)
+            frames += 1
+    finally:
+        out.release()
+    logger.info(f"Rendered {frames} frames to {output_path}")
+    return frames
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render an annotated video from a source video and its track sidecar.")
+    parser.add_argument("video", help="Source video the sidecar was recorded from")
+    parser.add_argument("sidecar", help="Output path given to process_video; its .tracks.bin/.tracks.json are read")
+    parser.add_argument("output")
+    parser.add_argument("--start", type=float, help="Start time in seconds")
+    parser.add_argument("--end", type=float, help="End time in seconds")
+    args = parser.parse_args(argv)
+    render_video(args.video, args.sidecar, args.output, args.start, args.end)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import csv
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from config import OUTPUT_DIR, TEMP_DIR
+from logger_config import setup_logger
+
+logger = setup_logger()
+
+UPLOAD_CHUNK_SIZE = 8 << 20
+CACHE_DIR = os.path.join(OUTPUT_DIR, "cache")
+CACHE_MAX_BYTES = int(float(os.getenv("RESULT_CACHE_MAX_GB", "20")) * (1 << 30))
+INDEX_VERSION = 1
+
+def save_upload(src, dest_path, chunk_size=UPLOAD_CHUNK_SIZE):
+    # Copies chunk by chunk and hashes on the way, so the video is never held twice in memory
+    h = hashlib.sha256()
+    tmp_path = dest_path + ".part"
+    if hasattr(src, "seek"):
+        src.seek(0)
+    with open(tmp_path, "wb") as f:
+        for chunk in iter(lambda: src.read(chunk_size), b""):
+            h.update(chunk)
+            f.write(chunk)
+    os.replace(tmp_path, dest_path)
+    return h.hexdigest()
+
+def stream_hash(src, chunk_size=UPLOAD_CHUNK_SIZE):
+    h = hashlib.sha256()
+    if hasattr(src, "seek"):
+        src.seek(0)
+    for chunk in iter(lambda: src.read(chunk_size), b""):
+        h.update(chunk)
+    return h.hexdigest()
+
+def file_hash(path, chunk_size=UPLOAD_CHUNK_SIZE):
+    with open(path, "rb") as f:
+        return stream_hash(f, chunk_size)
+
+def normalize_config(config):
+    # The video content is covered by its hash; the name and camera are written into every logged row
+    points = lambda pts: [[int(round(x)), int(round(y))] for x, y in pts]
+    return {
+        "video_name": config["video_name"],
+        "camera": config.get("camera") or config["video_name"],
+        "polygon_roi": points(config["polygon_roi"]),
+        "line_1": points(config["line_1"]),
+        "line_2": points(config["line_2"]),
+        "real_world_distance_m": round(float(config["real_world_distance_m"]), 3),
+    }
+
+def cache_key(video_hash, config, model_version, options=None):
+    payload = {
+        "video": video_hash,
+        "config": normalize_config(config),
+        "model": model_version,
+        "options": options or {},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+def dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+class ResultCache:
+    def __init__(self, root=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, managed_dirs=(OUTPUT_DIR, TEMP_DIR)):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.managed_dirs = managed_dirs
+        self.index_path = os.path.join(root, "index.json")
+        # One instance is shared by all Streamlit sessions in the process
+        self.lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self.entries = self._load_index()
+        self._drop_orphans()
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable result cache index {self.index_path}: {e}")
+            return {}
+        if index.get("version") != INDEX_VERSION:
+            return {}
+        return index["entries"]
+
+    def _drop_orphans(self):
+        # Folders of runs that crashed before being stored; nothing in this process is writing to them yet
+        indexed = {key[:24] for key in self.entries}
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if os.path.isdir(path) and name not in indexed:
+                logger.info(f"Removing unfinished result cache folder {path}")
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _save_index(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": INDEX_VERSION, "entries": self.entries}, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def entry_dir(self, key):
+        path = os.path.join(self.root, key[:24])
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def lookup(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if not all(os.path.exists(path) for path in entry["files"].values()):
+                logger.warning(f"Result cache entry {key[:12]} is missing files, dropping it")
+                self._remove(key)
+                self._save_index()
+                return None
+            entry["last_used"] = time.time()
+            entry["hits"] = entry.get("hits", 0) + 1
+            self._save_index()
+            return dict(entry)
+
+    def store(self, key, files, meta=None):
+        files = {name: path for name, path in files.items() if path and os.path.exists(path)}
+        with self.lock:
+            now = time.time()
+            entry_dir = self.entry_dir(key)
+            self.entries[key] = {
+                "dir": entry_dir,
+                "files": files,
+                "meta": meta or {},
+                "size": dir_size(entry_dir),
+                "created": now,
+                "last_used": now,
+                "hits": 0,
+            }
+            logger.info(f"Cached result {key[:12]} ({self.entries[key]['size'] / 1e6:.1f} MB)")
+            self._evict(protect=key)
+            self._save_index()
+
+    def discard(self, key):
+        # Drops a partial entry left by a failed or interrupted run
+        with self.lock:
+            self._remove(key)
+            self._save_index()
+
+    def _remove(self, key):
+        self.entries.pop(key, None)
+        shutil.rmtree(os.path.join(self.root, key[:24]), ignore_errors=True)
+
+    def _evict(self, protect=None):
+        # Usage is counted over the whole output and temp folders, but only cache entries are ever deleted
+        used = sum(dir_size(path) for path in self.managed_dirs)
+        for key in sorted(self.entries, key=lambda k: self.entries[k]["last_used"]):
+            if used <= self.max_bytes:
+                break
+            if key == protect:
+                continue
+            used -= self.entries[key]["size"]
+            logger.info(f"Evicting cached result {key[:12]}, last used {time.ctime(self.entries[key]['last_used'])}")
+            self._remove(key)
+        if used > self.max_bytes:
+            logger.warning(f"{OUTPUT_DIR} and {TEMP_DIR} use {used / 1e9:.2f} GB, above the "
+                           f"{self.max_bytes / 1e9:.2f} GB result cache budget, after evicting every other entry")
+
+def read_rows(csv_path):
+    with open(csv_path, "r", newline="") as f:
+        return list(csv.DictReader(f))
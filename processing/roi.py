@@ -0,0 +1,34 @@
+import cv2
+import numpy as np
+
+class RoiMask:
+    def __init__(self, polygon, frame_shape, padding=32):
+        height, width = frame_shape[:2]
+        self.polygon = np.array(polygon, np.int32)
+        self.mask = np.zeros((height, width), dtype=np.uint8)
+        cv2.fillPoly(self.mask, [self.polygon], 1)
+        self.mask = self.mask.astype(bool)
+
+        x, y, w, h = cv2.boundingRect(self.polygon)
+        self.crop_rect = (
+            max(0, x - padding),
+            max(0, y - padding),
+            min(width, x + w + padding),
+            min(height, y + h + padding),
+        )
+
+    def contains(self, points):
+        points = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+        height, width = self.mask.shape
+        inside = (points[:, 0] >= 0) & (points[:, 0] < width) & (points[:, 1] >= 0) & (points[:, 1] < height)
+        result = np.zeros(len(points), dtype=bool)
+        result[inside] = self.mask[points[inside, 1], points[inside, 0]]
+        return result
+
+    def crop(self, frame):
+        x1, y1, x2, y2 = self.crop_rect
+        return frame[y1:y2, x1:x2]
+
+    def to_frame(self, boxes):
+        x1, y1, _, _ = self.crop_rect
+        return boxes + np.array([x1, y1, x1, y1], dtype=boxes.dtype)
@@ -0,0 +1,192 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from processing.pipeline import BoundedQueue, END_OF_STREAM
+from processing.metrics import METRICS_PORT, metrics
+from processing.checkpoint import CheckpointStore, checkpoint_path_for, resume_frames
+from processing.track_video import (VideoSession, get_detector, iter_numbered_batches, load_config, open_source,
+                                    split_detections, wants_display)
+from tools.db_writer import create_default_writer
+from logger_config import setup_logger
+
+logger = setup_logger()
+
+class StreamWorker:
+    def __init__(self, name, input_path, config, output_path, queue_size=4, backpressure=None, stop_event=None,
+                 db_writer=None, ring_size=32, ingest_width=None, ingest_fps=None, output_mode="video",
+                 checkpoint_path=None, checkpoint_interval=30.0, display_every=1):
+        self.name = name
+        self.display_every = display_every
+        self.input_path = input_path
+        live = input_path.startswith("rtsp://")
+        checkpoint, resume = None, None
+        if checkpoint_path:
+            checkpoint = CheckpointStore(checkpoint_path, {"input": input_path, "config": config}, checkpoint_interval)
+            resume = checkpoint.load()
+        source = open_source(input_path, ring_size, ingest_width, ingest_fps,
+                             start_time=resume["t"] if resume and not live else None)
+        self.frame_gen = resume_frames(source.frames, resume, live) if resume else source.frames
+        self.fps, self.release = source.fps, source.release
+        self.start_frame = resume["frame_num"] + 1 if resume else 0
+        self.session = VideoSession(config, output_path, self.fps, source.width, source.height, db_writer=db_writer,
+                                    source_size=(source.source_width, source.source_height),
+                                    source_fps=source.source_fps, output_mode=output_mode,
+                                    checkpoint=checkpoint, resume=resume)
+        # Files can wait for the detector; only live streams drop frames to stay current
+        self.queue = BoundedQueue(queue_size, backpressure or ("drop_oldest" if live else "block"), stop_event)
+        self.finished = False
+        self.failed = False
+        self.frames_processed = 0
+        self.thread = threading.Thread(target=self._decode, name=f"decode-{name}", daemon=True)
+
+    def _decode(self):
+        try:
+            frames = metrics.timed_iter("decode", self.frame_gen, self.session.video_name)
+            for [(frame_num, t)], [frame] in iter_numbered_batches(frames, 1, self.fps, self.start_frame,
+                                                                  self.session.estimator.mark_gap):
+                if not self.queue.put((frame_num, t, frame)):
+                    return
+        except Exception as e:
+            self.failed = True
+            logger.error(f"Decoding failed for stream {self.name}: {e}")
+        self.queue.put(END_OF_STREAM, force_block=True)
+
+    def take(self, max_frames):
+        items = []
+        while len(items) < max_frames and not self.finished:
+            if self.queue.qsize() == 0:
+                break
+            item = self.queue.get()
+            if item is END_OF_STREAM:
+                self.finished = True
+                break
+            items.append(item)
+        return items
+
+    def process(self, items, detections_per_frame):
+        metrics.set_gauge("queue_depth_0", self.queue.qsize(), self.session.video_name)
+        metrics.set_gauge("frames_dropped", self.queue.dropped, self.session.video_name)
+        results = []
+        for (frame_num, t, frame), detections in zip(items, detections_per_frame):
+            annotations = self.session.track(frame_num, self.session.to_frame(detections), t=t)
+            results.append((frame_num, self.session.render(frame, annotations,
+                                                           wants_display(frame_num, self.display_every))))
+        self.frames_processed += len(items)
+        return results
+
+    def close(self):
+        if self.release:
+            self.release()
+        # A stream stopped by the scheduler keeps its checkpoint so a restart picks up its live tracks
+        outcome = "failed" if self.failed else "completed" if self.finished else "interrupted"
+        self.session.close(outcome)
+
+class MultiStreamScheduler:
+    def __init__(self, detector=None, max_batch=16, queue_size=4, backpressure="drop_oldest", idle_sleep=0.005,
+                 db_writer=None, display_every=1, metrics_port=METRICS_PORT):
+        self.detector = detector or get_detector()
+        self.owns_writer = db_writer is None
+        self.db_writer = create_default_writer() if self.owns_writer else db_writer
+        self.max_batch = max_batch
+        self.queue_size = queue_size
+        self.backpressure = backpressure
+        self.idle_sleep = idle_sleep
+        # run() yields a display frame every display_every frames per stream and None otherwise
+        self.display_every = display_every
+        # With METRICS_ENABLED=1, headless scheduler runs serve /metrics on metrics_port
+        if metrics.enabled and metrics_port:
+            metrics.enable(port=int(metrics_port))
+        self.stop_event = threading.Event()
+        self.workers = []
+        self._next = 0
+
+    def add_stream(self, name, input_path, config_path, output_path, ingest_width=None, ingest_fps=None,
+                   output_mode="video", checkpoint_path=None):
+        config = load_config(config_path)
+        backpressure = self.backpressure if input_path.startswith("rtsp://") else "block"
+        worker = StreamWorker(name, input_path, config, output_path, self.queue_size, backpressure, self.stop_event,
+                              self.db_writer, ring_size=self.queue_size + self.max_batch + 2,
+                              ingest_width=ingest_width, ingest_fps=ingest_fps, output_mode=output_mode,
+                              checkpoint_path=checkpoint_path, display_every=self.display_every)
+        self.workers.append(worker)
+        logger.info(f"Added stream {name}: {input_path}")
+        return worker
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _collect(self, active):
+        # Round-robin from a rotating start so no stream is starved when the batch fills up
+        quota = max(1, self.max_batch // len(active))
+        order = active[self._next % len(active):] + active[:self._next % len(active)]
+        self._next += 1
+
+        taken = []
+        total = 0
+        for worker in order:
+            if total >= self.max_batch:
+                break
+            items = worker.take(min(quota, self.max_batch - total))
+            if items:
+                taken.append((worker, items))
+                total += len(items)
+        return taken
+
+    def run(self):
+        for worker in self.workers:
+            worker.thread.start()
+
+        with ThreadPoolExecutor(max_workers=max(1, len(self.workers)), thread_name_prefix="stream-post") as pool:
+            try:
+                while not self.stop_event.is_set():
+                    active = [w for w in self.workers if not w.finished]
+                    if not active:
+                        break
+
+                    taken = self._collect(active)
+                    if not taken:
+                        time.sleep(self.idle_sleep)
+                        continue
+
+                    frames = [worker.session.prepare(frame) for worker, items in taken for _, _, frame in items]
+                    with metrics.timer("detect_shared"):
+                        batch_detections = self.detector.detect_batch(frames)
+                    split = [dets for _, dets in split_detections(range(len(frames)), batch_detections)]
+
+                    futures = []
+                    offset = 0
+                    for worker, items in taken:
+                        futures.append((worker, pool.submit(worker.process, items, split[offset:offset + len(items)])))
+                        offset += len(items)
+
+                    for worker, future in futures:
+                        for frame_num, display_frame in future.result():
+                            yield worker.name, frame_num, display_frame
+            finally:
+                self.stop_event.set()
+                # Let in-flight post-processing finish so checkpoints see a consistent tracker
+                pool.shutdown(wait=True)
+                for worker in self.workers:
+                    worker.thread.join(timeout=5)
+                    worker.close()
+                    logger.info(f"Stream {worker.name} finished after {worker.frames_processed} frames")
+                if self.owns_writer and self.db_writer:
+                    self.db_writer.close()
+                if metrics.enabled:
+                    logger.info(f"Scheduler metrics: {metrics.snapshot()}")
+
+def run_rtsp_streams(streams, config_for, output_dir, checkpoints=True, **kwargs):
+    # Nothing looks at the frames here, so none are prepared for display
+    kwargs.setdefault("display_every", 0)
+    scheduler = MultiStreamScheduler(**kwargs)
+    for name, url in streams:
+        config_path = config_for(name)
+        if not config_path:
+            logger.warning(f"No config for stream {name}, skipping")
+            continue
+        output_path = os.path.join(output_dir, f"processed_{name.replace(' ', '_')}.mp4")
+        scheduler.add_stream(name, url, config_path, output_path,
+                             checkpoint_path=checkpoint_path_for(output_path) if checkpoints else None)
+    for _ in scheduler.run():
+        pass
@@ -0,0 +1,243 @@
+import argparse
+import csv
+import math
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+import cv2
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from models.tracker import Tracker
+from processing.track_video import (LOG_FIELDS, VideoSession, event_clock, iter_numbered_batches, load_config,
+                                    open_source, split_detections)
+from tools.db_writer import create_default_writer
+from logger_config import log_event, setup_logger
+
+logger = setup_logger()
+
+Shard = namedtuple("Shard", ["index", "start", "core_start", "end"])
+
+_worker_detector = None
+
+def plan_shards(total_frames, n_shards, overlap_frames):
+    size = math.ceil(total_frames / n_shards)
+    shards = []
+    for i in range(n_shards):
+        core_start = i * size
+        if core_start >= total_frames:
+            break
+        # Each shard re-processes the tail of the previous one so tracks can be matched across the cut
+        shards.append(Shard(i, max(0, core_start - overlap_frames), core_start, min(total_frames, core_start + size)))
+    return shards
+
+def _init_worker(model_path):
+    global _worker_detector
+    from models.detector import create_detector
+
+    _worker_detector = create_detector(model_path=model_path)
+
+def run_shard(input_path, config, shard, overlap_frames, work_dir, batch_size=1):
+    source = open_source(input_path, start_frame=shard.start, max_frames=shard.end - shard.start)
+    segment_path = os.path.join(work_dir, f"segment_{shard.index:04d}.mp4")
+    session = VideoSession(config, segment_path, source.fps, source.width, source.height,
+                           source_size=(source.source_width, source.source_height), emit_events=False,
+                           log_csv=False)
+
+    crossings = {}
+    head = defaultdict(dict)
+    tail = defaultdict(dict)
+    tail_start = shard.end - overlap_frames
+
+    try:
+        for metas, batch in iter_numbered_batches(source.frames, batch_size, source.fps, shard.start):
+            batch_detections = session.detect(_worker_detector, batch)
+            for ((frame_num, t), detections), frame in zip(split_detections(metas, batch_detections), batch):
+                annotations = session.track(frame_num, detections, t=t)
+
+                for track in session.tracker.tracks:
+                    if track.no_losses:
+                        continue
+                    if frame_num < shard.core_start:
+                        head[frame_num][track.track_id] = track.box.tolist()
+                    if frame_num >= tail_start:
+                        tail[frame_num][track.track_id] = track.box.tolist()
+
+                # Copy crossing records before eviction drops them
+                for track_id, rec in session.estimator.cross_times.items():
+                    if rec.get("lines"):
+                        crossings[track_id] = dict(rec["lines"])
+
+                # Lead-in frames belong to the previous shard's segment
+                if frame_num >= shard.core_start:
+                    session.render(frame, annotations, display=False)
+    finally:
+        source.release()
+        session.close()
+
+    return {
+        "index": shard.index,
+        "segment": segment_path,
+        "fps": source.fps,
+        "crossings": crossings,
+        "head": dict(head),
+        "tail": dict(tail),
+    }
+
+def link_tracks(tail, head, min_iou=0.3):
+    frames = sorted(set(tail) & set(head))
+    a_ids = sorted({tid for f in frames for tid in tail[f]})
+    b_ids = sorted({tid for f in frames for tid in head[f]})
+    if not a_ids or not b_ids:
+        return {}
+
+    a_index = {tid: i for i, tid in enumerate(a_ids)}
+    b_index = {tid: i for i, tid in enumerate(b_ids)}
+    score = np.zeros((len(a_ids), len(b_ids)))
+    count = np.zeros((len(a_ids), len(b_ids)))
+    for f in frames:
+        a_tids, b_tids = list(tail[f]), list(head[f])
+        iou = Tracker.iou_matrix([tail[f][t] for t in a_tids], [head[f][t] for t in b_tids])
+        rows = [a_index[t] for t in a_tids]
+        cols = [b_index[t] for t in b_tids]
+        score[np.ix_(rows, cols)] += iou
+        count[np.ix_(rows, cols)] += 1
+
+    mean_iou = np.divide(score, count, out=np.zeros_like(score), where=count > 0)
+    rows, cols = linear_sum_assignment(-mean_iou)
+    return {b_ids[c]: a_ids[r] for r, c in zip(rows, cols) if mean_iou[r, c] > min_iou}
+
+def merge_shards(results, real_distance_m):
+    results = sorted(results, key=lambda r: r["index"])
+    parent = {}
+
+    def find(key):
+        while parent.get(key, key) != key:
+            key = parent[key]
+        return key
+
+    for prev, cur in zip(results, results[1:]):
+        for b_tid, a_tid in link_tracks(prev["tail"], cur["head"]).items():
+            parent[find((cur["index"], b_tid))] = find((prev["index"], a_tid))
+
+    merged = defaultdict(dict)
+    for result in results:
+        for track_id, lines in result["crossings"].items():
+            key = find((result["index"], track_id))
+            # Overlap frames are seen by two shards; keep the earliest time per line
+            for line_idx, t in lines.items():
+                merged[key][line_idx] = min(t, merged[key].get(line_idx, t))
+
+    events = []
+    for key, lines in merged.items():
+        if len(lines) < 2 or lines[0] == lines[1]:
+            continue
+        events.append((max(lines.values()), min(lines.values()), key))
+
+    fps = results[0]["fps"] if results else 25.0
+    rows = []
+    for track_id, (t2, t1, _) in enumerate(sorted(events)):
+        rows.append({
+            "track_id": track_id,
+            "speed_kmph": round(real_distance_m / (t2 - t1) * 3.6, 1),
+            "frame": int(round(t2 * fps)),
+            "t": t2,
+        })
+    return rows
+
+def concat_segments(segments, output_path):
+    if shutil.which("ffmpeg"):
+        list_path = output_path + ".segments.txt"
+        with open(list_path, "w") as f:
+            for segment in segments:
+                f.write(f"file '{os.path.abspath(segment)}'\n")
+        subprocess.run(['ffmpeg', '-y', '-v', 'error', '-f', 'concat', '-safe', '0', '-i', list_path, '-c', 'copy', output_path],
+                       check=True)
+        os.remove(list_path)
+        return
+
+    out = None
+    for segment in segments:
+        cap = cv2.VideoCapture(segment)
+        if out is None:
+            size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+            out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), cap.get(cv2.CAP_PROP_FPS), size)
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            out.write(frame)
+        cap.release()
+    if out is not None:
+        out.release()
+
+def process_video_sharded(input_path, config_path, output_path, workers=None, overlap_seconds=3.0,
+                          batch_size=1, model_path="yolo11n.pt", db_writer=None):
+    config = load_config(config_path)
+    workers = workers or os.cpu_count() or 2
+
+    cap = cv2.VideoCapture(input_path)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    cap.release()
+
+    overlap_frames = int(round(overlap_seconds * fps))
+    shards = plan_shards(total_frames, workers, overlap_frames)
+    logger.info(f"Processing {input_path} as {len(shards)} shards of ~{shards[0].end - shards[0].core_start} frames")
+
+    output_dir = os.path.dirname(output_path)
+    os.makedirs(output_dir, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix="shards_", dir=output_dir)
+
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=len(shards), mp_context=ctx, initializer=_init_worker,
+                             initargs=(model_path,)) as pool:
+        futures = [pool.submit(run_shard, input_path, config, shard, overlap_frames, work_dir, batch_size)
+                   for shard in shards]
+        results = [future.result() for future in futures]
+
+    rows = merge_shards(results, config["real_world_distance_m"])
+    concat_segments([r["segment"] for r in sorted(results, key=lambda r: r["index"])], output_path)
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    owns_writer = db_writer is None
+    if owns_writer:
+        db_writer = create_default_writer()
+
+    log_path = os.path.join(output_dir, f"speeds_{config['video_name']}.csv")
+    clock_base = event_clock(config)
+    with open(log_path, "w", newline="") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=LOG_FIELDS)
+        writer.writeheader()
+        for row in rows:
+            row = {"video": config["video_name"], "camera": config.get("camera") or config["video_name"], **row,
+                   "timestamp": str(datetime.now())}
+            row["event_time"] = str(clock_base + timedelta(seconds=row.pop("t")))
+            writer.writerow(row)
+            log_event("speed", **row)
+            if db_writer:
+                db_writer.submit(row)
+
+    if owns_writer and db_writer:
+        db_writer.close()
+    logger.info(f"Sharded processing of {input_path} finished: {len(rows)} speed records, video saved to {output_path}")
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Process one long video as parallel time shards.")
+    parser.add_argument("video")
+    parser.add_argument("config")
+    parser.add_argument("output")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--overlap", type=float, default=3.0, help="Overlap between shards in seconds")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--model", default="yolo11n.pt")
+    args = parser.parse_args(argv)
+    process_video_sharded(args.video, args.config, args.output, args.workers, args.overlap, args.batch_size, args.model)
+
+if __name__ == "__main__":
+    main()
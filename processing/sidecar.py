@@ -0,0 +1,96 @@
+import json
+import os
+import threading
+import numpy as np
+
+# One row per tracked box per processed frame; boxes are in source-video coordinates.
+# Frames without tracks get a single row with track_id -1 so a renderer knows they were empty.
+RECORD_DTYPE = np.dtype([
+    ("frame", "<u4"),
+    ("t", "<f8"),
+    ("track_id", "<i4"),
+    ("box", "<f4", (4,)),
+    ("speed", "<f4"),
+])
+EMPTY_TRACK_ID = -1
+SIDECAR_VERSION = 1
+
+def sidecar_paths(output_path):
+    base = os.path.splitext(output_path)[0]
+    return base + ".tracks.bin", base + ".tracks.json"
+
+class SidecarWriter:
+    def __init__(self, output_path, header, flush_frames=256, resume_frame=None):
+        self.data_path, self.header_path = sidecar_paths(output_path)
+        self.header = dict(header, version=SIDECAR_VERSION, dtype=RECORD_DTYPE.descr)
+        self.flush_frames = flush_frames
+        self.pending = []
+        self.pending_frames = 0
+        self.frames = 0
+        self.records = 0
+        # Checkpoints may flush from the tracking thread while the render thread appends
+        self.lock = threading.Lock()
+        with open(self.header_path, "w") as f:
+            json.dump(self.header, f, indent=2)
+        if resume_frame is not None and os.path.exists(self.data_path):
+            self._truncate_after(resume_frame)
+            self.file = open(self.data_path, "ab")
+        else:
+            self.file = open(self.data_path, "wb")
+
+    def _truncate_after(self, frame_num):
+        # Drop records past the checkpoint; they are produced again when processing resumes
+        records = np.fromfile(self.data_path, dtype=RECORD_DTYPE)
+        keep = int(np.searchsorted(records["frame"], frame_num, side="right"))
+        with open(self.data_path, "r+b") as f:
+            f.truncate(keep * RECORD_DTYPE.itemsize)
+        kept = records[:keep]
+        self.frames = len(np.unique(kept["frame"]))
+        self.records = int(np.count_nonzero(kept["track_id"] != EMPTY_TRACK_ID))
+
+    def append(self, frame_num, t, track_ids, boxes, speeds):
+        n = len(track_ids)
+        rows = np.zeros(max(n, 1), dtype=RECORD_DTYPE)
+        rows["frame"] = frame_num
+        rows["t"] = t
+        if n:
+            rows["track_id"] = track_ids
+            rows["box"] = boxes
+            rows["speed"] = [np.nan if s is None else s for s in speeds]
+        else:
+            rows["track_id"] = EMPTY_TRACK_ID
+            rows["speed"] = np.nan
+        with self.lock:
+            self.pending.append(rows)
+            self.pending_frames += 1
+            self.frames += 1
+            self.records += n
+            if self.pending_frames >= self.flush_frames:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if self.pending:
+            np.concatenate(self.pending).tofile(self.file)
+            self.file.flush()
+        self.pending = []
+        self.pending_frames = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+        self.header.update(frames=self.frames, records=self.records)
+        with open(self.header_path, "w") as f:
+            json.dump(self.header, f, indent=2)
+
+def read_sidecar(output_path):
+    data_path, header_path = sidecar_paths(output_path)
+    with open(header_path, "r") as f:
+        header = json.load(f)
+    if header.get("version") != SIDECAR_VERSION:
+        raise ValueError(f"Unsupported sidecar version {header.get('version')} in {header_path}")
+    records = np.fromfile(data_path, dtype=RECORD_DTYPE) if os.path.getsize(data_path) else np.zeros(0, RECORD_DTYPE)
+    return header, records
@@ -0,0 +1,49 @@
+from logger_config import setup_logger
+
+logger = setup_logger()
+
+class TrackStateEvictor:
+    def __init__(self, ttl_frames=None, ttl_seconds=None):
+        self.ttl_frames = ttl_frames
+        self.ttl_seconds = ttl_seconds
+        self.last_seen = {}
+        self.stores = {}
+        self.evicted_total = 0
+
+    def register(self, name, store):
+        self.stores[name] = store
+        return store
+
+    def touch(self, track_id, frame_num, t):
+        self.last_seen[track_id] = (frame_num, t)
+
+    def expired(self, frame_num, t):
+        expired = []
+        for track_id, (seen_frame, seen_t) in self.last_seen.items():
+            if self.ttl_frames is not None and frame_num - seen_frame > self.ttl_frames:
+                expired.append(track_id)
+            elif self.ttl_seconds is not None and t - seen_t > self.ttl_seconds:
+                expired.append(track_id)
+        return expired
+
+    def evict(self, frame_num, t, retired_ids=()):
+        to_evict = set(retired_ids)
+        if self.ttl_frames is not None or self.ttl_seconds is not None:
+            to_evict.update(self.expired(frame_num, t))
+
+        for track_id in to_evict:
+            self.last_seen.pop(track_id, None)
+            for store in self.stores.values():
+                if isinstance(store, dict):
+                    store.pop(track_id, None)
+                else:
+                    store.discard(track_id)
+
+        self.evicted_total += len(to_evict)
+        return to_evict
+
+    def live_counts(self):
+        counts = {name: len(store) for name, store in self.stores.items()}
+        counts["last_seen"] = len(self.last_seen)
+        counts["evicted_total"] = self.evicted_total
+        return counts
@@ -1,139 +1,615 @@
 import cv2
+import glob
 import json
+import shutil
+import threading
+import time
 import os
 import numpy as np
 import csv
-from datetime import datetime
-from collections import defaultdict
-from models.detector import YOLOv11Detector
+from collections import namedtuple
+from datetime import datetime, timedelta
+from models.detector import create_detector, DET_FRAME, DET_X1, DET_Y2
 from models.speed_estimator import SpeedEstimator
 from models.tracker import Tracker
-from tools.db_uploader import upload_csv_to_db
-from tools.ffmpeg_reader import read_frames_ffmpeg
-from logger_config import setup_logger
+from tools.db_writer import create_default_writer
+from tools.ffmpeg_reader import FFmpegFrameReader, GapEvent
+from processing.state_eviction import TrackStateEvictor
+from processing.pipeline import Pipeline
+from processing.adaptive_stride import AdaptiveStride
+from processing.roi import RoiMask
+from processing.motion_gate import MotionGate
+from processing.sidecar import SidecarWriter
+from processing.checkpoint import CheckpointStore, resume_frames
+from processing.metrics import metrics
+from logger_config import every, log_event, setup_logger
 
 logger = setup_logger()
 
-detector = YOLOv11Detector()
-tracker = Tracker()
+_detectors = {}
+_detector_lock = threading.Lock()
+
+LOG_FIELDS = ["video", "camera", "track_id", "speed_kmph", "timestamp", "event_time", "frame"]
+STATE_REPORT_INTERVAL = 1000
+CHECKPOINT_FLUSH_TIMEOUT = 60.0
+DISPLAY_WIDTH = 800
+OUTPUT_MODES = ("video", "sidecar", "both")
+
+Source = namedtuple("Source", ["frames", "fps", "width", "height", "release", "source_width", "source_height",
+                               "source_fps"])
+
+def get_detector(model_path="yolo11n.pt", warmup=True, backend=None):
+    # One warm detector per model and backend for the whole process; trackers stay per session
+    with _detector_lock:
+        key = (model_path, backend)
+        detector = _detectors.get(key)
+        if detector is None:
+            start = time.perf_counter()
+            detector = create_detector(backend, model_path)
+            logger.info(f"Loaded {type(detector).__name__} {model_path} in {time.perf_counter() - start:.2f}s")
+            if warmup:
+                detector.warmup()
+            _detectors[key] = detector
+        return detector
 
 def load_config(config_path):
+    if isinstance(config_path, dict):
+        return dict(config_path)
     with open(config_path, "r") as f:
         return json.load(f)
 
-def is_inside_polygon(point, polygon):
-    return cv2.pointPolygonTest(np.array(polygon, np.int32), point, False) >= 0
+def event_clock(config):
+    # Wall-clock time at video time 0; recordings can set recording_start, live streams start now
+    start = config.get("recording_start")
+    return datetime.fromisoformat(start) if start else datetime.now()
 
-def line_crossed(center, line):
-    (x1, y1), (x2, y2) = line
-    return y1 <= center[1] <= y2 or y2 <= center[1] <= y1
+def scale_points(points, sx, sy):
+    return [[int(round(x * sx)), int(round(y * sy))] for x, y in points]
 
-def gen_frames_from_cap(cap):
-    while cap.isOpened():
+def gen_frames_from_cap(cap, step=1, size=None, max_frames=None):
+    produced = 0
+    while cap.isOpened() and (max_frames is None or produced < max_frames):
+        # grab() skips decimated frames without converting them
+        for _ in range(step - 1):
+            if not cap.grab():
+                return
         ret, frame = cap.read()
         if not ret:
             break
-        yield frame.copy()
+        t = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        if size is not None:
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        produced += 1
+        yield frame, t
 
-def process_video(input_path, config_path, output_path):
-    config = load_config(config_path)
-    roi_polygon = config["polygon_roi"]
-    line1 = config["line_1"]
-    line2 = config["line_2"]
-    real_dist = config["real_world_distance_m"]
-    video_name = config["video_name"]
+def wants_display(frame_num, display_every):
+    return bool(display_every) and frame_num % display_every == 0
 
-    logger.info(f"Loaded config from {config_path}")
+def draw_overlay(frame, annotations, roi_polygon, line1, line2):
+    for _, (x1, y1, x2, y2), show_speed in annotations:
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        if show_speed is not None:
+            cv2.putText(frame, f"{show_speed} km/h", (x1, y2 + 20), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
 
-    use_rtsp = input_path.startswith("rtsp://")
-    if use_rtsp:
-        width, height, fps = 704, 576, 25
-        frame_gen = read_frames_ffmpeg(input_path, width, height)
-        logger.info(f"Using FFmpeg reader for RTSP stream: {input_path} (fps={fps}, resolution={width}x{height})")
-    else:
-        cap = cv2.VideoCapture(input_path)
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        frame_gen = gen_frames_from_cap(cap)
-        logger.info(f"Video FPS: {fps}, Resolution: {width} * {height}")
-
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
-
-    estimator = SpeedEstimator(real_dist)
-    track_log = []
-    persistent_speeds = {}
-    logged_track_ids = set()
-
-    frame_num = 0
-    for frame in frame_gen:
-        if frame is None:
-            logger.info("End of video or frame stream.")
+    cv2.polylines(frame, [np.array(roi_polygon, np.int32)], isClosed=True, color=(255, 0, 0), thickness=2)
+    cv2.line(frame, tuple(line1[0]), tuple(line1[1]), (0, 255, 255), 2)
+    cv2.line(frame, tuple(line2[0]), tuple(line2[1]), (0, 255, 255), 2)
+    return frame
+
+def iter_batches(frame_gen, batch_size, on_gap=None):
+    batch = []
+    for item in frame_gen:
+        if item is None or item[0] is None:
             break
+        if isinstance(item[0], GapEvent):
+            # t is the last timestamp before the stream dropped
+            if on_gap and item[1] is not None:
+                on_gap(item[1])
+            continue
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def iter_numbered_batches(frame_gen, batch_size, fps, start_frame=0, on_gap=None):
+    # Yields ([(frame_num, t), ...], [frame, ...]); t falls back to frame_num / fps when the source has no pts
+    frame_num = start_frame
+    for batch in iter_batches(frame_gen, batch_size, on_gap):
+        metas = []
+        for i, (_, t) in enumerate(batch):
+            metas.append((frame_num + i, t if t is not None else (frame_num + i) / fps))
+        yield metas, [frame for frame, _ in batch]
+        frame_num += len(batch)
+
+def ring_size_for(batch_size, queue_size, pipelined):
+    # Frames from the ffmpeg ring are reused, so the ring must outlive every frame still in flight
+    in_flight = batch_size * (queue_size * 4 + 4) if pipelined else batch_size
+    return in_flight + 2
+
+def open_source(input_path, ring_size=32, ingest_width=None, ingest_fps=None, start_frame=0, max_frames=None,
+                start_time=None):
+    use_rtsp = input_path.startswith("rtsp://")
+    frame_range = bool(start_frame) or max_frames is not None
+    if use_rtsp and (frame_range or start_time):
+        raise ValueError("Frame ranges and seeking are only supported for video files")
+    # Files go through ffmpeg too when downscaling, so the scale happens at decode time
+    if use_rtsp or ((ingest_width or ingest_fps) and not frame_range and shutil.which("ffmpeg")):
+        reader = FFmpegFrameReader(input_path, ring_size=ring_size, reconnect=use_rtsp,
+                                   target_width=ingest_width, target_fps=ingest_fps, start_time=start_time)
+        logger.info(f"Using FFmpeg reader for {input_path} (fps={reader.fps}, resolution={reader.width}x{reader.height})")
+        return Source(iter(reader), reader.fps, reader.width, reader.height, reader.close,
+                      reader.source_width, reader.source_height, reader.source_fps)
+
+    cap = cv2.VideoCapture(input_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    source_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    source_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    logger.info(f"Video FPS: {fps}, Resolution: {source_width} * {source_height}")
+    if start_frame:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    elif start_time:
+        cap.set(cv2.CAP_PROP_POS_MSEC, start_time * 1000.0)
+
+    step = max(1, int(round(fps / ingest_fps))) if ingest_fps and ingest_fps < fps else 1
+    width, height, size = source_width, source_height, None
+    if ingest_width and ingest_width < source_width:
+        width = ingest_width
+        height = max(2, int(round(source_height * ingest_width / source_width / 2)) * 2)
+        size = (width, height)
+    if step > 1 or size:
+        logger.info(f"Ingesting every {step} frame(s) at {width} * {height}")
+    return Source(gen_frames_from_cap(cap, step, size, max_frames), fps / step, width, height, cap.release,
+                  source_width, source_height, fps)
+
+class VideoSession:
+    def __init__(self, config, output_path, fps, width, height, tracker=None, ttl_frames=None, ttl_seconds=None,
+                 roi_crop=True, roi_padding=32, db_writer=None, source_size=None, annotate_original=False,
+                 output_mode="video", started=None, checkpoint=None, resume=None, emit_events=True,
+                 log_csv=True, source_fps=None):
+        if output_mode not in OUTPUT_MODES:
+            raise ValueError(f"Unknown output mode {output_mode!r}, expected one of {OUTPUT_MODES}")
+        # Config geometry is drawn on source frames; processing happens at the ingest resolution
+        self.source_size = tuple(source_size) if source_size else (width, height)
+        self.ingest_scale = (width / self.source_size[0], height / self.source_size[1])
+        self.source_geometry = (config["polygon_roi"], config["line_1"], config["line_2"])
+        self.roi_polygon, self.line1, self.line2 = (
+            scale_points(points, *self.ingest_scale) for points in self.source_geometry
+        )
+        self.annotate_original = annotate_original
+        self.video_name = config["video_name"]
+        # Off where rows are provisional, e.g. per-shard speeds that are re-derived when shards are stitched
+        self.emit_events = emit_events
+        self.camera = config.get("camera") or self.video_name
+        self.clock_base = event_clock(config)
+        self.output_path = output_path
+        self.fps = fps
+        self.source_fps = source_fps or fps
+        self.tracker = tracker if tracker is not None else Tracker()
+        self.roi = RoiMask(self.roi_polygon, (height, width), roi_padding)
+        self.roi_crop = roi_crop
+        self.db_writer = db_writer
+
+        output_dir = os.path.dirname(output_path)
+        os.makedirs(output_dir, exist_ok=True)
+
+        # Sidecar mode records tracks and speeds only; the annotated video can be rendered from it later
+        self.out = None
+        if output_mode in ("video", "both"):
+            # An mp4 cut off by a crash cannot be appended to, so a resumed run writes a new part
+            self.video_path = output_path
+            if resume:
+                base, ext = os.path.splitext(output_path)
+                self.video_path = f"{base}.from{resume['frame_num'] + 1:08d}{ext}"
+            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+            self.out = cv2.VideoWriter(self.video_path, fourcc, fps,
+                                       self.source_size if annotate_original else (width, height))
+        self.sidecar = None
+        if output_mode in ("sidecar", "both"):
+            self.sidecar = SidecarWriter(output_path, {
+                "video_name": self.video_name,
+                "fps": fps,
+                "source_size": list(self.source_size),
+                "polygon_roi": self.source_geometry[0],
+                "line_1": self.source_geometry[1],
+                "line_2": self.source_geometry[2],
+            }, resume_frame=resume["frame_num"] if resume else None)
+        # Shards write no CSV of their own; only the stitched rows are logged
+        self.log_path = os.path.join(output_dir, f"speeds_{self.video_name}.csv") if log_csv else None
+        self.csvfile = None
+        if log_csv and resume:
+            # Rows written after the checkpoint are produced again, so cut them off
+            self.csvfile = open(self.log_path, "r+", newline="")
+            self.csvfile.truncate(resume["csv_offset"])
+            self.csvfile.seek(resume["csv_offset"])
+            self.log_writer = csv.DictWriter(self.csvfile, fieldnames=LOG_FIELDS)
+        elif log_csv:
+            self.csvfile = open(self.log_path, "w", newline="")
+            self.log_writer = csv.DictWriter(self.csvfile, fieldnames=LOG_FIELDS)
+            self.log_writer.writeheader()
+
+        self.estimator = SpeedEstimator(config["real_world_distance_m"])
+        self.evictor = TrackStateEvictor(ttl_frames=ttl_frames, ttl_seconds=ttl_seconds)
+        self.evictor.register("cross_times", self.estimator.cross_times)
+        self.persistent_speeds = self.evictor.register("persistent_speeds", {})
+        self.logged_track_ids = self.evictor.register("logged_track_ids", set())
+        self.stride = None
+        self.gate = None
+        self.started = started if started is not None else time.perf_counter()
+        self.first_frame_seconds = None
+
+        # With checkpoints, DB rows are held back until the checkpoint that covers them
+        self.checkpoint = checkpoint
+        self.outbox = []
+        self.last_frame = None
+        if resume:
+            self.restore(resume)
+
+    def state(self, frame_num, t):
+        return {
+            "frame_num": frame_num,
+            "t": t,
+            "tracker": self.tracker.snapshot(),
+            "cross_times": self.estimator.cross_times,
+            "persistent_speeds": self.persistent_speeds,
+            "logged_track_ids": self.logged_track_ids,
+            "last_seen": self.evictor.last_seen,
+            "csv_offset": self.csvfile.tell() if self.csvfile else None,
+            "clock_base": self.clock_base,
+        }
+
+    def restore(self, state):
+        self.tracker.restore(state["tracker"])
+        # Update in place; the evictor holds references to these stores
+        self.estimator.cross_times.update(state["cross_times"])
+        self.persistent_speeds.update(state["persistent_speeds"])
+        self.logged_track_ids.update(state["logged_track_ids"])
+        self.evictor.last_seen.update(state["last_seen"])
+        self.last_frame = (state["frame_num"], state["t"])
+        self.clock_base = state["clock_base"]
+
+    def save_checkpoint(self):
+        if self.checkpoint is None or self.last_frame is None:
+            return False
+        if self.csvfile:
+            self.csvfile.flush()
+        if self.sidecar is not None:
+            self.sidecar.flush()
+        if self.db_writer:
+            for row in self.outbox:
+                self.db_writer.submit(row)
+            self.outbox = []
+            # Rows must be durable before the checkpoint marks them as logged
+            if not self.db_writer.flush(CHECKPOINT_FLUSH_TIMEOUT):
+                logger.warning("DB writer did not settle in time, skipping checkpoint")
+                return False
+        with metrics.timer("checkpoint", self.video_name):
+            self.checkpoint.save(self.state(*self.last_frame))
+        return True
+
+    def prepare(self, frame):
+        return self.roi.crop(frame) if self.roi_crop else frame
+
+    def to_frame(self, boxes):
+        return self.roi.to_frame(boxes) if self.roi_crop else boxes
+
+    def to_original(self, boxes):
+        sx, sy = self.ingest_scale
+        return np.asarray(boxes, dtype=float).reshape(-1, 4) / np.array([sx, sy, sx, sy])
+
+    def detect(self, detector, frames):
+        with metrics.timer("detect", self.video_name):
+            detections = detector.detect_batch([self.prepare(frame) for frame in frames])
+        detections[:, DET_X1:DET_Y2 + 1] = self.to_frame(detections[:, DET_X1:DET_Y2 + 1])
+        return detections
+
+    def detect_frames(self, detector, metas, frames):
+        # Pairs each (frame_num, t) with its detections, or None where the motion gate skipped the detector
+        if self.gate is None:
+            return list(split_detections(metas, self.detect(detector, frames)))
+
+        run, audits = [], []
+        for i, ((frame_num, _), frame) in enumerate(zip(metas, frames)):
+            if self.gate.should_detect(frame_num, frame):
+                run.append(i)
+            elif self.gate.audit_due():
+                audits.append(i)
+        results = [(meta, None) for meta in metas]
+        metrics.inc("detector_skipped_total", len(metas) - len(run), self.video_name)
+        if not run and not audits:
+            return results
+
+        indices = run + audits
+        batch_detections = self.detect(detector, [frames[i] for i in indices])
+        for i, (_, detections) in zip(indices, split_detections(range(len(indices)), batch_detections)):
+            if i in audits:
+                boxes = detections.astype(int)
+                centers = np.column_stack(((boxes[:, 0] + boxes[:, 2]) // 2, (boxes[:, 1] + boxes[:, 3]) // 2))
+                in_roi = detections[self.roi.contains(centers)]
+                self.gate.record_audit(metas[i][0], self.untracked(in_roi))
+                if not len(in_roi):
+                    continue
+            results[i] = (metas[i], detections)
+        return results
 
-        logger.debug(f"[FRAME] Processing frame {frame_num}")
-        detections = detector.detect(frame)
-        logger.debug(f"Detections in frame {frame_num}: {len(detections)}")
+    def untracked(self, boxes):
+        # Detections that overlap no live or coasting track, e.g. not a car parked since the gate closed
+        track_boxes = [track.box for track in self.tracker.tracks]
+        if not len(boxes) or not track_boxes:
+            return len(boxes)
+        iou = self.tracker.iou_matrix(track_boxes, boxes)
+        return int(np.count_nonzero(iou.max(axis=0) <= self.tracker.iou_threshold))
 
-        tracks = tracker.update([det[:4] for det in detections])
-        logger.debug(f"Tracking {len(tracks)} objects in frame {frame_num}")
+    def track(self, frame_num, detections, t_uncertainty=None, t=None):
+        with metrics.timer("track", self.video_name):
+            if detections is None:
+                tracks = self.tracker.advance()
+            else:
+                logger.debug("Detections in frame %d: %d", frame_num, len(detections), extra=every(1.0))
+                tracks = self.tracker.update(detections)
+        logger.debug("Tracking %d objects in frame %d", len(tracks), frame_num, extra=every(1.0))
+        estimate_start = time.perf_counter()
 
-        for track in tracks:
-            x1, y1, x2, y2 = map(int, track.box)
-            cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
+        if t is None:
+            t = frame_num / self.fps
+        if t_uncertainty is None:
+            t_uncertainty = 1 / self.fps
+        annotations = []
+        boxes = np.array([track.box for track in tracks], dtype=float).reshape(-1, 4).astype(int)
+        inside = self.roi.contains(np.column_stack(((boxes[:, 0] + boxes[:, 2]) // 2, (boxes[:, 1] + boxes[:, 3]) // 2)))
+        for track, (x1, y1, x2, y2), in_roi in zip(tracks, boxes.tolist(), inside):
+            self.evictor.touch(track.track_id, frame_num, t)
+            center = ((x1 + x2) / 2, (y1 + y2) / 2)
 
-            if not is_inside_polygon((cx, cy), roi_polygon):
+            if not in_roi:
                 continue
 
-            speed = estimator.update_and_get_speed(
-                track.track_id, cy, frame_num / fps, line1[0][1], line2[0][1]
+            speed = self.estimator.update_and_get_speed(
+                track.track_id, center, t, self.line1, self.line2, t_uncertainty
             )
 
             if speed:
-                logger.info(f"Speed for track_id {track.track_id}: {speed} km/h")
-                persistent_speeds[track.track_id] = speed
+                logger.info("Speed for track_id %s: %s km/h", track.track_id, speed)
+                if self.stride:
+                    self.stride.record_speed_error(self.estimator.cross_times[track.track_id].get("error_kmph"))
+                self.persistent_speeds[track.track_id] = speed
 
-                if track.track_id not in logged_track_ids:
-                    track_log.append({
-                        "video": video_name,
+                if track.track_id not in self.logged_track_ids:
+                    row = {
+                        "video": self.video_name,
+                        "camera": self.camera,
                         "track_id": track.track_id,
                         "speed_kmph": speed,
                         "timestamp": str(datetime.now()),
-                        "frame": frame_num
-                    })
-                    logged_track_ids.add(track.track_id)
-
-            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-
-            if track.track_id in persistent_speeds:
-                show_speed = persistent_speeds[track.track_id]
-                cv2.putText(frame, f"{show_speed} km/h", (x1, y2 + 20), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-
-        cv2.polylines(frame, [np.array(roi_polygon, np.int32)], isClosed=True, color=(255, 0, 0), thickness=2)
-        cv2.line(frame, line1[0], line1[1], (0, 255, 255), 2)
-        cv2.line(frame, line2[0], line2[1], (0, 255, 255), 2)
-
-        out.write(frame)
-        display_frame = cv2.resize(frame, (800, int(800 * frame.shape[0] / frame.shape[1])))
-        
-        yield display_frame
-        frame_num += 1
-    
-    if not use_rtsp:
-        cap.release()
-
-    out.release()
-
-    output_dir = os.path.dirname(output_path)
-    os.makedirs(output_dir, exist_ok=True)
-    log_path = os.path.join(output_dir, f"speeds_{video_name}.csv")
-    
-    with open(log_path, "w", newline="") as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=["video", "track_id", "speed_kmph", "timestamp", "frame"])
-        writer.writeheader()
-        for row in track_log:
-            writer.writerow(row)
-        logger.info(f"Video saved to {output_path}")
-
-    upload_csv_to_db(log_path)
+                        "event_time": str(self.clock_base + timedelta(seconds=t)),
+                        "frame": self.source_frame(frame_num, t)
+                    }
+                    if self.csvfile:
+                        self.log_writer.writerow(row)
+                        self.csvfile.flush()
+                    if self.emit_events:
+                        log_event("speed", **row)
+                    if self.db_writer and self.checkpoint is not None:
+                        self.outbox.append(row)
+                    elif self.db_writer:
+                        self.db_writer.submit(row)
+                    self.logged_track_ids.add(track.track_id)
+
+            annotations.append((track.track_id, (x1, y1, x2, y2), self.persistent_speeds.get(track.track_id)))
+
+        self.evictor.evict(frame_num, t, self.tracker.pop_retired())
+        if frame_num % STATE_REPORT_INTERVAL == 0:
+            logger.info("Live track state at frame %d: %s", frame_num, self.evictor.live_counts())
+
+        metrics.observe("estimate", time.perf_counter() - estimate_start, self.video_name)
+        metrics.set_gauge("live_tracks", len(self.tracker.tracks), self.video_name)
+        # Recorded here rather than at render time so a checkpoint always covers the sidecar up to its frame
+        if self.sidecar is not None:
+            self.record(frame_num, t, annotations)
+        self.last_frame = (frame_num, t)
+        if self.checkpoint is not None and self.checkpoint.due():
+            self.save_checkpoint()
+        return annotations
+
+    def source_frame(self, frame_num, t):
+        # Rows point into the source video; with decimated ingest frame_num only counts the kept frames
+        if self.source_fps == self.fps:
+            return frame_num
+        return int(round(t * self.source_fps))
+
+    def annotate(self, frame, annotations):
+        with metrics.timer("draw", self.video_name):
+            return self._annotate(frame, annotations)
+
+    def _annotate(self, frame, annotations):
+        roi_polygon, line1, line2 = self.roi_polygon, self.line1, self.line2
+        if self.annotate_original and self.ingest_scale != (1.0, 1.0):
+            frame = cv2.resize(frame, self.source_size)
+            roi_polygon, line1, line2 = self.source_geometry
+            annotations = [
+                (track_id, tuple(int(v) for v in self.to_original(box)[0]), show_speed)
+                for track_id, box, show_speed in annotations
+            ]
+        return draw_overlay(frame, annotations, roi_polygon, line1, line2)
+
+    def record(self, frame_num, t, annotations):
+        with metrics.timer("sidecar", self.video_name):
+            track_ids = [track_id for track_id, _, _ in annotations]
+            boxes = self.to_original([box for _, box, _ in annotations])
+            self.sidecar.append(frame_num, t, track_ids, boxes, [speed for _, _, speed in annotations])
+
+    def frame_done(self):
+        if self.first_frame_seconds is None:
+            self.first_frame_seconds = time.perf_counter() - self.started
+            logger.info(f"Time to first processed frame for {self.video_name}: {self.first_frame_seconds:.2f}s")
+            metrics.set_gauge("time_to_first_frame_seconds", round(self.first_frame_seconds, 3), self.video_name)
+        metrics.frame_done(self.video_name)
+
+    def write(self, frame, display=True):
+        if self.out is not None:
+            with metrics.timer("encode", self.video_name):
+                self.out.write(frame)
+        self.frame_done()
+        if not display:
+            return None
+        return cv2.resize(frame, (DISPLAY_WIDTH, int(DISPLAY_WIDTH * frame.shape[0] / frame.shape[1])))
+
+    def render(self, frame, annotations, display=True):
+        # Drawing is skipped entirely when nothing is encoded and no consumer wants the frame
+        if self.out is None and not display:
+            self.frame_done()
+            return None
+        return self.write(self.annotate(frame, annotations), display)
+
+    def join_video_parts(self):
+        # Every resumed run wrote its own part; the finished video is all of them in frame order
+        from processing.sharded import concat_segments
+
+        base, ext = os.path.splitext(self.output_path)
+        parts = [path for path in [self.output_path] + sorted(glob.glob(f"{glob.escape(base)}.from*{ext}"))
+                 if os.path.exists(path)]
+        joined_path = f"{base}.joined{ext}"
+        try:
+            concat_segments(parts, joined_path)
+        except Exception as e:
+            logger.warning(f"Could not join video parts {parts}, keeping them as they are: {e}")
+            return
+        if not os.path.exists(joined_path):
+            # A part cut off by a crash has no index and cannot be read back
+            logger.warning(f"Could not join video parts {parts}, keeping them as they are")
+            return
+        os.replace(joined_path, self.output_path)
+        for path in parts[1:]:
+            os.remove(path)
+        self.video_path = self.output_path
+
+    def close(self, outcome="completed"):
+        # outcome is "completed", "interrupted" (stopped from outside, e.g. a redeploy) or "failed"
+        if self.stride:
+            logger.info(f"Adaptive stride report: {self.stride.report()}")
+        if self.gate:
+            logger.info(f"Motion gate report: {self.gate.report()}")
+        if self.checkpoint is not None:
+            if outcome == "completed":
+                if self.db_writer:
+                    for row in self.outbox:
+                        self.db_writer.submit(row)
+                    self.outbox = []
+                self.checkpoint.clear()
+            elif outcome == "interrupted":
+                self.save_checkpoint()
+        if self.out is not None:
+            self.out.release()
+            if outcome == "completed" and self.video_path != self.output_path:
+                self.join_video_parts()
+            logger.info(f"Video saved to {self.video_path}")
+        if self.sidecar is not None:
+            self.sidecar.close()
+            logger.info(f"Track sidecar saved to {self.sidecar.data_path} ({self.sidecar.records} records)")
+        if self.csvfile:
+            self.csvfile.close()
+        return self.log_path
+
+def split_detections(keys, batch_detections):
+    frame_ids = batch_detections[:, DET_FRAME].astype(np.int64)
+    for batch_idx, key in enumerate(keys):
+        yield key, batch_detections[frame_ids == batch_idx, DET_X1:DET_Y2 + 1]
+
+def process_video(input_path, config_path, output_path, batch_size=1, ttl_frames=None, ttl_seconds=None,
+                  pipelined=False, queue_size=8, backpressure="block", detector=None,
+                  adaptive_stride=False, max_stride=4, roi_crop=True, roi_padding=32, db_writer=None,
+                  ingest_width=None, ingest_fps=None, annotate_original=False, output_mode="video", display_every=1,
+                  checkpoint_path=None, checkpoint_interval=30.0, motion_gate=False, gate_audit_every=0):
+    # Yields a display frame every display_every frames and None otherwise; 0 never builds display frames
+    started = time.perf_counter()
+    if adaptive_stride and pipelined:
+        raise ValueError("adaptive_stride needs tracker feedback before each detection and cannot run pipelined")
+
+    config = load_config(config_path)
+    logger.info(f"Loaded config for {config['video_name']}")
+
+    owns_writer = db_writer is None
+    if owns_writer:
+        db_writer = create_default_writer()
+
+    live = input_path.startswith("rtsp://")
+    checkpoint, resume = None, None
+    if checkpoint_path:
+        checkpoint = CheckpointStore(checkpoint_path, {"input": input_path, "config": config}, checkpoint_interval)
+        resume = checkpoint.load()
+
+    source = open_source(input_path, ring_size_for(batch_size, queue_size, pipelined), ingest_width, ingest_fps,
+                         start_time=resume["t"] if resume and not live else None)
+    frames = resume_frames(source.frames, resume, live) if resume else source.frames
+    frame_gen = metrics.timed_iter("decode", frames, config["video_name"])
+    fps, release = source.fps, source.release
+    start_frame = resume["frame_num"] + 1 if resume else 0
+    session = VideoSession(config, output_path, fps, source.width, source.height, ttl_frames=ttl_frames,
+                           ttl_seconds=ttl_seconds, roi_crop=roi_crop, roi_padding=roi_padding, db_writer=db_writer,
+                           source_size=(source.source_width, source.source_height), source_fps=source.source_fps,
+                           annotate_original=annotate_original, output_mode=output_mode, started=started,
+                           checkpoint=checkpoint, resume=resume)
+    if motion_gate:
+        session.gate = MotionGate(session.roi, fps, audit_every=gate_audit_every)
+    detector = detector or get_detector()
+
+    outcome = "failed"
+    try:
+        if pipelined:
+            yield from run_pipelined(session, detector, frame_gen, fps, batch_size, queue_size, backpressure,
+                                     display_every, start_frame)
+        elif adaptive_stride:
+            session.stride = AdaptiveStride(fps, [session.line1, session.line2], max_stride=max_stride)
+            yield from run_adaptive(session, detector, frame_gen, fps, display_every, start_frame)
+        else:
+            for metas, batch in iter_numbered_batches(frame_gen, batch_size, fps, start_frame, session.estimator.mark_gap):
+                for ((frame_num, t), detections), frame in zip(session.detect_frames(detector, metas, batch), batch):
+                    logger.debug("[FRAME] Processing frame %d", frame_num, extra=every(1.0))
+                    annotations = session.track(frame_num, detections, t=t)
+                    yield session.render(frame, annotations, wants_display(frame_num, display_every))
+        logger.info("End of video or frame stream.")
+        outcome = "completed"
+    except (GeneratorExit, KeyboardInterrupt, SystemExit):
+        outcome = "interrupted"
+        raise
+    finally:
+        if release:
+            release()
+        session.close(outcome)
+        if owns_writer and db_writer:
+            db_writer.close()
+
+def run_adaptive(session, detector, frame_gen, fps, display_every=1, start_frame=0):
+    stride = session.stride
+    for [(frame_num, t)], [frame] in iter_numbered_batches(frame_gen, 1, fps, start_frame, session.estimator.mark_gap):
+        detections = None
+        if stride.should_detect(frame_num):
+            [(_, detections)] = session.detect_frames(detector, [(frame_num, t)], [frame])
+        annotations = session.track(frame_num, detections, stride.t_uncertainty(frame_num), t=t)
+        stride.observe(frame_num, session.tracker)
+        yield session.render(frame, annotations, wants_display(frame_num, display_every))
+
+def run_pipelined(session, detector, frame_gen, fps, batch_size, queue_size, backpressure, display_every=1,
+                  start_frame=0):
+    def infer(item):
+        metas, batch = item
+        yield batch, session.detect_frames(detector, metas, batch)
+
+    def track(item):
+        batch, frame_detections = item
+        for ((frame_num, t), detections), frame in zip(frame_detections, batch):
+            yield frame_num, frame, session.track(frame_num, detections, t=t)
+
+    def render(item):
+        frame_num, frame, annotations = item
+        yield session.render(frame, annotations, wants_display(frame_num, display_every))
+
+    pipeline = Pipeline(
+        iter_numbered_batches(frame_gen, batch_size, fps, start_frame, session.estimator.mark_gap),
+        [("infer", infer), ("track", track), ("render", render)],
+        queue_size=queue_size,
+        backpressure=backpressure,
+        name=session.video_name,
+    )
+    yield from pipeline
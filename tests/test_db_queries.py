@@ -0,0 +1,85 @@
+import os
+import sqlite3
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+import pytest
+from db.queries import SpeedQueries, percentile_from_bins
+from db.schema import create_schema, rebuild_rollups, write_rows
+
+def make_row(camera, speed, event_time, i=0):
+    return {"video": f"{camera}.mp4", "camera": camera, "track_id": i, "speed_kmph": speed,
+            "timestamp": "2025-06-05 15:00:00", "event_time": event_time, "frame": i}
+
+ROWS = [
+    make_row("cam-A", 42.3, "2025-06-05 14:00:05", 1),
+    make_row("cam-A", 55.0, "2025-06-05 14:00:40", 2),
+    make_row("cam-A", 70.0, "2025-06-05 14:01:10", 3),
+    make_row("cam-A", 42.9, "2025-06-05 14:16:00", 4),
+    make_row("cam-B", 30.0, "2025-06-05 14:00:20", 5),
+]
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    create_schema(conn, "sqlite")
+    # Two batches, so the rollups are upserted onto existing keys
+    for batch in (ROWS[:2], ROWS[2:]):
+        cursor = conn.cursor()
+        write_rows(cursor, batch, "sqlite", speed_limit=50.0)
+        cursor.close()
+    conn.commit()
+    yield conn
+    conn.close()
+
+def test_minute_rollups(conn):
+    minutes = conn.execute("SELECT * FROM vehicle_speed_minutes ORDER BY camera, minute").fetchall()
+    assert minutes == [
+        ("cam-A", "2025-06-05 14:00:00", 2, pytest.approx(97.3), 55.0, 1),
+        ("cam-A", "2025-06-05 14:01:00", 1, 70.0, 70.0, 1),
+        ("cam-A", "2025-06-05 14:16:00", 1, 42.9, 42.9, 0),
+        ("cam-B", "2025-06-05 14:00:00", 1, 30.0, 30.0, 0),
+    ]
+
+def test_histogram_rollups(conn):
+    bins = conn.execute("SELECT camera, bin, SUM(vehicles) FROM vehicle_speed_histogram "
+                        "GROUP BY camera, bin ORDER BY camera, bin").fetchall()
+    assert bins == [("cam-A", 42, 2), ("cam-A", 55, 1), ("cam-A", 70, 1), ("cam-B", 30, 1)]
+
+def test_rebuild_matches_incremental_rollups(conn):
+    minutes = conn.execute("SELECT * FROM vehicle_speed_minutes ORDER BY camera, minute").fetchall()
+    bins = conn.execute("SELECT * FROM vehicle_speed_histogram ORDER BY camera, minute, bin").fetchall()
+    assert rebuild_rollups(conn, "sqlite", speed_limit=50.0) == len(minutes)
+    assert conn.execute("SELECT * FROM vehicle_speed_minutes ORDER BY camera, minute").fetchall() == minutes
+    assert conn.execute("SELECT * FROM vehicle_speed_histogram ORDER BY camera, minute, bin").fetchall() == bins
+
+def test_summary(conn):
+    queries = SpeedQueries(conn, "sqlite")
+    assert queries.cameras() == ["cam-A", "cam-B"]
+    [cam_a] = queries.summary(start="2025-06-05 14:00", end="2025-06-05 14:15", cameras=["cam-A"])
+    assert cam_a["vehicles"] == 3
+    assert cam_a["mean_kmph"] == round((42.3 + 55.0 + 70.0) / 3, 1)
+    assert cam_a["max_kmph"] == 70.0
+    assert cam_a["over_limit"] == 2
+    # The p85 vehicle sits in the 70 km/h bin, whose midpoint is above the fastest vehicle
+    assert cam_a["p85_kmph"] == 70.0
+
+def test_summary_buckets(conn):
+    buckets = SpeedQueries(conn, "sqlite").summary(cameras=["cam-A"], bucket_minutes=15)
+    assert [(str(b["bucket_start"]), b["vehicles"]) for b in buckets] == [
+        ("2025-06-05 14:00:00+00:00", 3),
+        ("2025-06-05 14:15:00+00:00", 1),
+    ]
+
+def test_vehicles(conn):
+    rows = SpeedQueries(conn, "sqlite").vehicles("cam-A", start="2025-06-05 14:00:30", end="2025-06-05 14:02")
+    assert [(row["track_id"], row["speed_kmph"]) for row in rows] == [(2, 55.0), (3, 70.0)]
+
+def test_percentile_from_bins():
+    assert percentile_from_bins([], 0.85) is None
+    assert percentile_from_bins([(40, 10), (60, 2)], 0.85) == 60.5
+    assert percentile_from_bins([(40, 10), (60, 2)], 0.5) == 40.5
+    assert percentile_from_bins([(40, 10), (60, 2)], 0.85, max_value=60.2) == 60.2
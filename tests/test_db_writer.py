@@ -0,0 +1,90 @@
+import os
+import sqlite3
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from tools.db_writer import AsyncDBWriter, SQLiteBackend
+
+class FlakyBackend(SQLiteBackend):
+    # Records every write call and fails the first `failures` of them
+    def __init__(self, path, failures=0):
+        super().__init__(path)
+        self.failures = failures
+        self.calls = []
+
+    def write_rows(self, rows):
+        self.calls.append(len(rows))
+        if self.failures:
+            self.failures -= 1
+            raise sqlite3.OperationalError("database is locked")
+        super().write_rows(rows)
+
+def make_row(i):
+    return {"video": "cam.mp4", "camera": "cam", "track_id": i, "speed_kmph": 40.0 + i % 20,
+            "timestamp": "2025-06-05 14:00:00", "event_time": f"2025-06-05 14:{i % 60:02d}:00", "frame": i}
+
+def logged_rows(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM vehicle_speed_logs").fetchone()[0]
+    finally:
+        conn.close()
+
+def writer_for(tmp_path, backend, **kwargs):
+    kwargs.setdefault("backoff", 0.01)
+    return AsyncDBWriter(backend, spool_path=str(tmp_path / "spool.jsonl"), **kwargs)
+
+def test_rows_are_coalesced_into_batches(tmp_path):
+    db_path = str(tmp_path / "speeds.db")
+    backend = FlakyBackend(db_path)
+    writer = writer_for(tmp_path, backend, batch_size=100, flush_interval=10.0)
+    for i in range(250):
+        writer.submit(make_row(i))
+    assert writer.flush(timeout=10)
+    assert backend.calls == [100, 100, 50]
+    writer.close()
+    assert logged_rows(db_path) == 250
+
+def test_failed_writes_are_retried(tmp_path):
+    db_path = str(tmp_path / "speeds.db")
+    backend = FlakyBackend(db_path, failures=2)
+    writer = writer_for(tmp_path, backend, max_retries=5)
+    for i in range(10):
+        writer.submit(make_row(i))
+    assert writer.flush(timeout=10)
+    assert backend.calls == [10, 10, 10]
+    assert (writer.rows_written, writer.rows_spooled) == (10, 0)
+    writer.close()
+    assert logged_rows(db_path) == 10
+
+def test_rows_are_spooled_then_replayed(tmp_path):
+    db_path = str(tmp_path / "speeds.db")
+    spool_path = tmp_path / "spool.jsonl"
+    backend = FlakyBackend(db_path, failures=3)
+    writer = writer_for(tmp_path, backend, max_retries=3)
+    for i in range(5):
+        writer.submit(make_row(i))
+    assert writer.flush(timeout=10)
+    assert writer.rows_spooled == 5
+    assert len(spool_path.read_text().splitlines()) == 5
+
+    # The next flush writes the spooled rows back before the new ones
+    writer.submit(make_row(5))
+    assert writer.flush(timeout=10)
+    assert not spool_path.exists()
+    assert backend.calls[-2:] == [5, 1]
+    writer.close()
+    assert logged_rows(db_path) == 6
+
+def test_close_drains_the_queue(tmp_path):
+    db_path = str(tmp_path / "speeds.db")
+    writer = writer_for(tmp_path, FlakyBackend(db_path), batch_size=1000, flush_interval=60.0)
+    for i in range(300):
+        writer.submit(make_row(i))
+    writer.close()
+    assert not writer.thread.is_alive()
+    assert writer.rows_written == 300
+    assert logged_rows(db_path) == 300
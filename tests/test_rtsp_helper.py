@@ -0,0 +1,110 @@
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+import numpy as np
+import requests
+from tools.rtsp_helper import SnapshotCache, VdointelClient
+
+class FakeResponse:
+    def __init__(self, body, status_code=200):
+        self.body = body
+        self.status_code = status_code
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error")
+
+class FakeVdointel:
+    # Stands in for requests.Session against the VDOintel API; lastid is exclusive unless inclusive=True
+    def __init__(self, device_ids, expires_in=3600, inclusive=False):
+        self.devices = [{"id": i, "devicename": f"cam-{i}", "substream": f"rtsp://u:p@10.0.0.{i}/sub"}
+                        for i in device_ids]
+        self.expires_in = expires_in
+        self.inclusive = inclusive
+        self.tokens_issued = 0
+        self.revoked = set()
+        self.device_requests = []
+
+    def post(self, url, data=None, headers=None, timeout=None):
+        assert url.endswith("/token") and data["grant_type"] == "password"
+        self.tokens_issued += 1
+        return FakeResponse({"access_token": f"token-{self.tokens_issued}", "expires_in": self.expires_in})
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        token = headers["Authorization"].split()[-1]
+        if token in self.revoked:
+            return FakeResponse({"detail": "revoked"}, 401)
+        self.device_requests.append(dict(params))
+        last_id = params["lastid"]
+        after = [d for d in self.devices if (d["id"] >= last_id if self.inclusive else d["id"] > last_id)]
+        return FakeResponse(after[:params["limit"]])
+
+def make_client(server, page_size=2):
+    client = VdointelClient(base_url="http://vdointel.test/", username="user", password="secret",
+                            page_size=page_size)
+    client.session = server
+    return client
+
+def test_token_is_cached_until_expiry():
+    server = FakeVdointel([1, 2, 3])
+    client = make_client(server)
+    client.streams()
+    client.streams()
+    assert server.tokens_issued == client.token_requests == 1
+
+    # expires_in below the refresh margin means every call refreshes
+    server = FakeVdointel([1], expires_in=30)
+    client = make_client(server)
+    client.streams()
+    client.streams()
+    assert server.tokens_issued == 2
+
+def test_revoked_token_is_refreshed_once():
+    server = FakeVdointel([1, 2])
+    client = make_client(server)
+    client.streams()
+    server.revoked.add("token-1")
+    assert [name for name, _ in client.streams()] == ["cam-1", "cam-2"]
+    assert server.tokens_issued == 2
+
+def test_pagination_returns_every_device_once():
+    server = FakeVdointel([1, 2, 3, 4, 5])
+    streams = make_client(server).streams()
+    assert [name for name, _ in streams] == ["cam-1", "cam-2", "cam-3", "cam-4", "cam-5"]
+    assert [params["lastid"] for params in server.device_requests] == [0, 2, 4]
+    assert streams[0][1] == "rtsp://u:p@10.0.0.1/sub"
+
+def test_pagination_with_inclusive_lastid():
+    server = FakeVdointel([1, 2, 3, 4, 5], inclusive=True)
+    streams = make_client(server, page_size=3).streams()
+    assert [name for name, _ in streams] == ["cam-1", "cam-2", "cam-3", "cam-4", "cam-5"]
+
+def test_snapshot_cache_reuses_fresh_frames_and_keeps_the_last_good_one():
+    calls = []
+    results = iter([np.ones((2, 2, 3), np.uint8), None])
+
+    def fetch(url, width, height, timeout):
+        calls.append(url)
+        return next(results)
+
+    cache = SnapshotCache(ttl=60.0, fetch=fetch)
+    try:
+        frame = cache.get("rtsp://cam-1", timeout=5)
+        assert frame is not None
+        assert cache.get("rtsp://cam-1", timeout=5) is frame
+        assert calls == ["rtsp://cam-1"]
+
+        # A failed refresh of a stale entry keeps serving the previous frame
+        cache.frames["rtsp://cam-1"] = (time.monotonic() - 120.0, frame)
+        assert cache.get("rtsp://cam-1", timeout=5) is frame
+        assert len(calls) == 2
+    finally:
+        cache.close()
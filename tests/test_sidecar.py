@@ -0,0 +1,30 @@
+import os
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+import numpy as np
+from benchmarks.stub_detector import StubDetector
+from benchmarks.synthetic import generate
+from processing.render import render_video
+from processing.sidecar import EMPTY_TRACK_ID, read_sidecar
+from processing.track_video import process_video
+
+def test_sidecar_mode_survives_frames_without_tracks(tmp_path):
+    # The synthetic road is empty for the first frames, so the sidecar starts with trackless frames
+    video_path, config_path, _ = generate(str(tmp_path), n_frames=120, n_vehicles=3)
+    output_path = str(tmp_path / "processed_synthetic.mp4")
+    for _ in process_video(video_path, config_path, output_path, detector=StubDetector(), output_mode="sidecar",
+                           display_every=0):
+        pass
+
+    header, records = read_sidecar(output_path)
+    assert header["frames"] == 120
+    assert records[0]["track_id"] == EMPTY_TRACK_ID
+    assert np.count_nonzero(records["track_id"] != EMPTY_TRACK_ID) == header["records"] > 0
+
+    rendered = str(tmp_path / "rendered.mp4")
+    render_video(video_path, output_path, rendered)
+    assert os.path.getsize(rendered) > 0
@@ -0,0 +1,44 @@
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+import numpy as np
+from models.speed_estimator import SpeedEstimator
+from processing.track_video import iter_numbered_batches
+from tools import ffmpeg_reader
+from tools.ffmpeg_reader import FFmpegFrameReader, GapEvent
+
+LINE_1 = [(0, 100), (200, 100)]
+LINE_2 = [(0, 200), (200, 200)]
+
+def test_no_speed_across_a_reconnect_gap():
+    # The vehicle crosses line 1 before the stream drops and line 2 after it comes back
+    estimator = SpeedEstimator(10.0)
+    frame = np.zeros((4, 4, 3), np.uint8)
+    items = [(frame, 0.0), (frame, 0.1), (GapEvent(0.1, "stream ended", 1, 1.0), 0.1), (frame, 5.0), (frame, 5.1)]
+    points = [(100, 90), (100, 110), (100, 190), (100, 210)]
+    speeds = []
+    for metas, _ in iter_numbered_batches(iter(items), 2, 10.0, on_gap=estimator.mark_gap):
+        for (_, t), point in zip(metas, points[:len(metas)]):
+            speeds.append(estimator.update_and_get_speed(1, point, t, LINE_1, LINE_2))
+        points = points[len(metas):]
+    assert speeds == [None, None, None, None]
+
+def test_probe_retries_while_the_stream_is_down(monkeypatch):
+    calls = []
+
+    def probe(url, rtsp_transport="tcp"):
+        calls.append(url)
+        if len(calls) < 3:
+            raise subprocess.CalledProcessError(1, "ffprobe")
+        return 64, 48, 25.0
+
+    monkeypatch.setattr(ffmpeg_reader, "probe_stream", probe)
+    monkeypatch.setattr(ffmpeg_reader.time, "sleep", lambda _: None)
+    reader = FFmpegFrameReader("rtsp://camera/stream", ring_size=2, reconnect=True, backoff=0.01)
+    assert (reader.width, reader.height, reader.fps) == (64, 48, 25.0)
+    assert len(calls) == 3
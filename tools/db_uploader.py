@@ -2,6 +2,7 @@ import psycopg2
 import csv
 from dotenv import load_dotenv
 import os
+from db.schema import write_rows
 from logger_config import setup_logger
 
 logger = setup_logger()
@@ -15,24 +16,12 @@ def upload_csv_to_db(csv_path):
         cursor = conn.cursor()
 
         with open(csv_path, "r") as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                cursor.execute(
-                    """
-                        INSERT INTO vehicle_speed_logs (video, track_id, speed_kmph, timestamp, frame) VALUES (%s, %s, %s, %s, %s)
-                    """, 
-                    (
-                        row["video"],
-                        int(row["track_id"]),
-                        float(row["speed_kmph"]),
-                        row["timestamp"],
-                        int(row["frame"])
-                    )
-                )
+            # Rollups are updated in the same transaction as the raw rows
+            write_rows(cursor, list(csv.DictReader(file)), "postgres")
         
         conn.commit()
         cursor.close()
         conn.close()
         logger.info(f"Uploaded data from {csv_path} to NeonDB")
     except Exception as e:
-        logger.error(f"Error uploading CSV to DB: {e}")
\ No newline at end of file
+        logger.error(f"Error uploading CSV to DB: {e}")
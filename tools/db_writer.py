@@ -0,0 +1,195 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from dotenv import load_dotenv
+from config import TEMP_DIR
+from db.schema import SPEED_LIMIT_KMPH, create_schema, write_rows
+from processing.metrics import metrics
+from logger_config import setup_logger
+
+logger = setup_logger()
+
+load_dotenv()
+NEON_DB_URL = os.getenv("NEON_DB_URL")
+
+DEFAULT_SPOOL_PATH = os.path.join(TEMP_DIR, "db_spool.jsonl")
+
+class PostgresBackend:
+    def __init__(self, dsn=NEON_DB_URL, minconn=1, maxconn=4, speed_limit=SPEED_LIMIT_KMPH):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.speed_limit = speed_limit
+        self.pool = None
+
+    def _get_pool(self):
+        # Connect lazily so an unreachable DB surfaces as a retryable write error
+        if self.pool is None:
+            from psycopg2.pool import ThreadedConnectionPool
+
+            self.pool = ThreadedConnectionPool(self.minconn, self.maxconn, self.dsn)
+        return self.pool
+
+    def write_rows(self, rows):
+        pool = self._get_pool()
+        conn = pool.getconn()
+        try:
+            with conn.cursor() as cursor:
+                write_rows(cursor, rows, "postgres", self.speed_limit)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            # Drop connections that broke mid-write instead of returning them to the pool
+            pool.putconn(conn, close=bool(conn.closed))
+            raise
+        pool.putconn(conn)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.closeall()
+
+class SQLiteBackend:
+    def __init__(self, path=":memory:", speed_limit=SPEED_LIMIT_KMPH):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.speed_limit = speed_limit
+        create_schema(self.conn, "sqlite")
+
+    def write_rows(self, rows):
+        with self.lock:
+            try:
+                write_rows(self.conn.cursor(), rows, "sqlite", self.speed_limit)
+            except Exception:
+                self.conn.rollback()
+                raise
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+class AsyncDBWriter:
+    def __init__(self, backend, batch_size=100, flush_interval=2.0, max_retries=5, backoff=0.5,
+                 max_backoff=30.0, spool_path=DEFAULT_SPOOL_PATH):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.spool_path = spool_path
+        self.queue = queue.Queue()
+        self.rows_written = 0
+        self.rows_spooled = 0
+        self.rows_submitted = 0
+        self.rows_settled = 0
+        self._settled = threading.Condition()
+        self._flushing = threading.Event()
+        self._closed = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, row):
+        with self._settled:
+            self.rows_submitted += 1
+        self.queue.put(dict(row))
+
+    def flush(self, timeout=None):
+        # Waits until every row submitted so far is written or spooled, both of which survive a crash
+        self._flushing.set()
+        try:
+            with self._settled:
+                target = self.rows_submitted
+                return self._settled.wait_for(lambda: self.rows_settled >= target, timeout)
+        finally:
+            self._flushing.clear()
+
+    def _settle(self, n):
+        with self._settled:
+            self.rows_settled += n
+            self._settled.notify_all()
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+            elif self._closed.is_set() and self.queue.empty():
+                return
+
+    def _next_batch(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=min(timeout, 0.2)))
+            except queue.Empty:
+                if self._closed.is_set() or self._flushing.is_set():
+                    break
+        return batch
+
+    def _write(self, rows):
+        delay = self.backoff
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                self._replay_spool()
+                with metrics.timer("db"):
+                    self.backend.write_rows(rows)
+                self.rows_written += len(rows)
+                self._settle(len(rows))
+                logger.debug("Wrote %d speed rows to DB", len(rows))
+                return True
+            except Exception as e:
+                logger.warning(f"DB write failed (attempt {attempt}/{self.max_retries}): {e}")
+                if attempt == self.max_retries or self._closed.is_set():
+                    break
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+
+        metrics.inc("db_rows_spooled_total", len(rows))
+        self._spool(rows)
+        self._settle(len(rows))
+        return False
+
+    def _spool(self, rows):
+        with open(self.spool_path, "a") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+        self.rows_spooled += len(rows)
+        logger.error(f"DB unavailable, spooled {len(rows)} rows to {self.spool_path}")
+
+    def _replay_spool(self):
+        if not os.path.exists(self.spool_path) or os.path.getsize(self.spool_path) == 0:
+            return
+
+        with open(self.spool_path, "r") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        for start in range(0, len(rows), self.batch_size):
+            try:
+                self.backend.write_rows(rows[start:start + self.batch_size])
+            except Exception:
+                # Keep only the rows that have not been written yet
+                with open(self.spool_path, "w") as f:
+                    for row in rows[start:]:
+                        f.write(json.dumps(row) + "\n")
+                raise
+            self.rows_written += len(rows[start:start + self.batch_size])
+        os.remove(self.spool_path)
+        logger.info(f"Replayed {len(rows)} spooled rows to DB")
+
+    def close(self, timeout=30):
+        self._closed.set()
+        self.thread.join(timeout=timeout)
+        self.backend.close()
+        logger.info(f"DB writer closed: {self.rows_written} rows written, {self.rows_spooled} spooled")
+
+def create_default_writer(**kwargs):
+    if not NEON_DB_URL:
+        logger.warning("NEON_DB_URL is not set, speed rows will only be written to CSV")
+        return None
+    return AsyncDBWriter(PostgresBackend(NEON_DB_URL), **kwargs)
@@ -1,24 +1,219 @@
+import json
+import queue
+import re
 import subprocess
+import threading
+import time
+from collections import namedtuple
 import numpy as np
+from logger_config import setup_logger
 
-def read_frames_ffmpeg(rtsp_url, width=704, height=576):
-    cmd = [
-        'ffmpeg',
-        '-rtsp_transport', 'tcp',
-        '-i', rtsp_url,
-        '-f', 'image2pipe',
-        '-pix_fmt', 'bgr24',
-        '-vcodec', 'rawvideo', '-'
+logger = setup_logger()
+
+FrameEvent = namedtuple("FrameEvent", ["frame", "pts"])
+GapEvent = namedtuple("GapEvent", ["last_pts", "reason", "attempt", "backoff"])
+
+PTS_RE = re.compile(rb"pts_time:\s*(-?[0-9.]+)")
+
+def _parse_rate(rate):
+    try:
+        num, den = rate.split("/")
+        return float(num) / float(den) if float(den) else 0.0
+    except (ValueError, AttributeError):
+        return 0.0
+
+def probe_stream(url, timeout=15, rtsp_transport="tcp"):
+    cmd = ['ffprobe', '-v', 'error']
+    if url.startswith("rtsp://"):
+        cmd += ['-rtsp_transport', rtsp_transport]
+    cmd += [
+        '-select_streams', 'v:0',
+        '-show_entries', 'stream=width,height,avg_frame_rate,r_frame_rate',
+        '-of', 'json', url
     ]
+    out = subprocess.run(cmd, capture_output=True, timeout=timeout, check=True).stdout
+    stream = json.loads(out)["streams"][0]
+    fps = _parse_rate(stream.get("avg_frame_rate")) or _parse_rate(stream.get("r_frame_rate")) or 25.0
+    return int(stream["width"]), int(stream["height"]), fps
+
+class FFmpegFrameReader:
+    def __init__(self, url, width=None, height=None, fps=None, ring_size=32, reconnect=True,
+                 backoff=1.0, max_backoff=30.0, max_reconnects=None, rtsp_transport="tcp",
+                 target_width=None, target_fps=None, start_time=None):
+        self.url = url
+        self.start_time = start_time
+        self.rtsp_transport = rtsp_transport
+        self.reconnect = reconnect
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_reconnects = max_reconnects
+        if width is None or height is None or fps is None:
+            p_width, p_height, p_fps = self._probe()
+            width, height, fps = width or p_width, height or p_height, fps or p_fps
+        self.source_width = width
+        self.source_height = height
+        self.source_fps = fps
+        # Scaling and decimation happen inside ffmpeg so only the reduced frames cross the pipe
+        if target_width and target_width < width:
+            height = max(2, int(round(height * target_width / width / 2)) * 2)
+            width = target_width
+        self.target_fps = target_fps if target_fps and target_fps < fps else None
+        self.width = width
+        self.height = height
+        self.fps = self.target_fps or fps
+        self.frame_bytes = width * height * 3
+        # Frames are handed out as views into this ring; a slot is overwritten ring_size reads later
+        self.ring = np.empty((ring_size, height, width, 3), dtype=np.uint8)
+        self.ring_size = ring_size
+        self.gaps = []
+        self.pipe = None
+        self._pts_queue = None
+        self._stopped = False
+
+    def _probe(self):
+        # A camera that is down at startup gets the same backoff as one that drops mid-stream
+        attempt = 0
+        delay = self.backoff
+        while True:
+            try:
+                return probe_stream(self.url, rtsp_transport=self.rtsp_transport)
+            except (subprocess.SubprocessError, ValueError, KeyError, IndexError) as e:
+                if not self.reconnect or (self.max_reconnects is not None and attempt >= self.max_reconnects):
+                    raise
+                attempt += 1
+                logger.warning(f"FFmpeg probe of {self.url} failed: {e}, retrying in {delay:.1f}s (attempt {attempt})")
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+
+    def _command(self):
+        cmd = ['ffmpeg', '-hide_banner', '-loglevel', 'info']
+        if self.url.startswith("rtsp://"):
+            cmd += ['-rtsp_transport', self.rtsp_transport]
+        if self.start_time:
+            # Input seeking jumps to the preceding keyframe and decodes forward to the exact time
+            cmd += ['-ss', f"{self.start_time:.3f}"]
+        filters = []
+        if self.target_fps:
+            filters.append(f"fps={self.target_fps}")
+        if (self.width, self.height) != (self.source_width, self.source_height):
+            filters.append(f"scale={self.width}:{self.height}:flags=area")
+        filters.append("showinfo")
+        cmd += [
+            '-i', self.url,
+            '-vf', ",".join(filters),
+            '-f', 'rawvideo',
+            '-pix_fmt', 'bgr24',
+            '-vsync', 'passthrough',
+            '-'
+        ]
+        return cmd
+
+    def _read_pts(self, stderr, pts_queue):
+        for line in iter(stderr.readline, b""):
+            match = PTS_RE.search(line)
+            if match:
+                pts_queue.put(float(match.group(1)))
+        pts_queue.put(None)
+
+    def _start(self):
+        self.pipe = subprocess.Popen(self._command(), stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=self.frame_bytes)
+        self._pts_queue = queue.Queue()
+        threading.Thread(target=self._read_pts, args=(self.pipe.stderr, self._pts_queue), daemon=True).start()
+
+    def _stop_process(self):
+        if self.pipe is None:
+            return
+        self.pipe.terminate()
+        try:
+            self.pipe.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.pipe.kill()
+        self.pipe.stdout.close()
+        self.pipe.stderr.close()
+        self.pipe = None
+
+    def _read_into(self, buf):
+        view = memoryview(buf).cast("B")
+        filled = 0
+        while filled < self.frame_bytes:
+            n = self.pipe.stdout.readinto(view[filled:])
+            if not n:
+                return False
+            filled += n
+        return True
+
+    def _next_pts(self, fallback):
+        try:
+            pts = self._pts_queue.get(timeout=1.0)
+        except queue.Empty:
+            return fallback
+        return fallback if pts is None else pts
+
+    def events(self):
+        slot = 0
+        attempt = 0
+        delay = self.backoff
+        last_pts = None
+        # Offset keeps timestamps monotonic across reconnects, where the stream pts restarts,
+        # and keeps them absolute after a seek, where the output pts starts from zero
+        pts_offset = self.start_time or 0.0
+        first_pts = None
+        gap_started = time.monotonic()
+
+        while not self._stopped:
+            self._start()
+            frames_in_session = 0
+
+            while not self._stopped:
+                buf = self.ring[slot]
+                if not self._read_into(buf):
+                    break
+                fallback = (first_pts or 0.0) + frames_in_session / self.fps
+                pts = self._next_pts(fallback)
+                if first_pts is None:
+                    first_pts = pts
+                    if last_pts is not None:
+                        pts_offset = last_pts + (time.monotonic() - gap_started) - pts
+                last_pts = pts + pts_offset
+                frames_in_session += 1
+                attempt = 0
+                delay = self.backoff
+                yield FrameEvent(buf, last_pts)
+                slot = (slot + 1) % self.ring_size
+
+            gap_started = time.monotonic()
+            self._stop_process()
+            if self._stopped or not self.reconnect:
+                return
+            if self.max_reconnects is not None and attempt >= self.max_reconnects:
+                logger.error(f"FFmpeg reader giving up on {self.url} after {attempt} reconnects")
+                return
+
+            attempt += 1
+            gap = GapEvent(last_pts, "stream ended" if frames_in_session else "connect failed", attempt, delay)
+            self.gaps.append(gap)
+            logger.warning(f"FFmpeg stream gap on {self.url}: {gap.reason}, reconnecting in {delay:.1f}s (attempt {attempt})")
+            yield gap
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_backoff)
+            first_pts = None
 
-    pipe = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=10**8)
+    def __iter__(self):
+        # Gaps come through as (GapEvent, last_pts) so consumers can drop state that spans them
+        for event in self.events():
+            if isinstance(event, FrameEvent):
+                yield event.frame, event.pts
+            else:
+                yield event, event.last_pts
 
-    while True:
-        raw_frame = pipe.stdout.read(width * height * 3)
-        if len(raw_frame) != width * height * 3:
-            break
-        frame = np.frombuffer(raw_frame, dtype=np.uint8).reshape((height, width, 3)).copy()
-        yield frame
+    def close(self):
+        self._stopped = True
+        self._stop_process()
 
-    pipe.stdout.close()
-    pipe.terminate()
+def read_frames_ffmpeg(rtsp_url, width=None, height=None):
+    reader = FFmpegFrameReader(rtsp_url, width=width, height=height, reconnect=False)
+    try:
+        for frame, _ in reader:
+            yield frame.copy()
+    finally:
+        reader.close()
@@ -1,22 +1,35 @@
 import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 from urllib.parse import quote
 import re
-import ffmpeg
 import numpy as np
-import cv2
+from logger_config import setup_logger
+
+logger = setup_logger()
 
 load_dotenv()
 VDOINTEL_BASE_URL = os.getenv("VDOINTEL_BASE_URL")
 VDOINTEL_USERNAME = os.getenv("VDOINTEL_USERNAME")
 VDOINTEL_PASSWORD = os.getenv("VDOINTEL_PASSWORD")
 
+DEVICE_PAGE_SIZE = 100
+DEVICE_LIST_TTL = 300.0
+# Refresh tokens this long before the server says they expire
+TOKEN_EXPIRY_MARGIN = 60.0
+DEFAULT_TOKEN_LIFETIME = 3600.0
+
 def safe_rtsp_url(url: str) -> str:
     pattern = r'rtsp://([^:]+):(.+?)@([^:/]+)(?::(\d+))?(/.+)'
     match = re.match(pattern, url)
     if not match:
-        print("⚠️ Could not parse RTSP URL. Using original.")
+        logger.warning("Could not parse RTSP URL. Using original.")
         return url
 
     username, password, host, port, path = match.groups()
@@ -29,51 +42,121 @@ def safe_rtsp_url(url: str) -> str:
     safe_url += path
     return safe_url
 
-def get_rtsp_streams():
-    try:
-        token_resp = requests.post(
-            f"{VDOINTEL_BASE_URL}/token",
-            data={
-                "username": VDOINTEL_USERNAME,
-                "password": VDOINTEL_PASSWORD,
-                "grant_type": "password"
-            },
-            headers={
-                "Content-Type": "application/x-www-form-urlencoded"
-            }
-        )
+class VdointelClient:
+    def __init__(self, base_url=VDOINTEL_BASE_URL, username=VDOINTEL_USERNAME, password=VDOINTEL_PASSWORD,
+                 page_size=DEVICE_PAGE_SIZE, timeout=10.0, pool_size=8):
+        self.base_url = base_url.rstrip("/")
+        self.username = username
+        self.password = password
+        self.page_size = page_size
+        self.timeout = timeout
+        # One keep-alive pool for every request; transient gateway errors are retried with backoff
+        self.session = requests.Session()
+        retry = Retry(total=3, backoff_factor=0.3, status_forcelist=(502, 503, 504), allowed_methods=None)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.lock = threading.Lock()
+        self._token = None
+        self._token_expires = 0.0
+        self.token_requests = 0
 
-        if token_resp.status_code != 200:
-            print("❌ Failed to get token.")
-            return []
+    def token(self):
+        with self.lock:
+            if self._token and time.monotonic() < self._token_expires:
+                return self._token
+            resp = self.session.post(
+                f"{self.base_url}/token",
+                data={
+                    "username": self.username,
+                    "password": self.password,
+                    "grant_type": "password"
+                },
+                headers={
+                    "Content-Type": "application/x-www-form-urlencoded"
+                },
+                timeout=self.timeout,
+            )
+            resp.raise_for_status()
+            body = resp.json()
+            if not body.get("access_token"):
+                raise ValueError("access_token missing in token response")
+            lifetime = float(body.get("expires_in") or DEFAULT_TOKEN_LIFETIME)
+            self._token = body["access_token"]
+            self._token_expires = time.monotonic() + max(0.0, lifetime - TOKEN_EXPIRY_MARGIN)
+            self.token_requests += 1
+            return self._token
 
-        token = token_resp.json().get("access_token")
-        if not token:
-            print("❌ access_token missing in response.")
-            return []
+    def invalidate_token(self):
+        with self.lock:
+            self._token = None
 
-        headers = {"Authorization": f"Bearer {token}"}
+    def get(self, path, params=None):
+        for attempt in range(2):
+            resp = self.session.get(f"{self.base_url}{path}", params=params, timeout=self.timeout,
+                                    headers={"Authorization": f"Bearer {self.token()}"})
+            # A token revoked before its expiry gets one fresh retry
+            if resp.status_code == 401 and attempt == 0:
+                self.invalidate_token()
+                continue
+            resp.raise_for_status()
+            return resp.json()
 
-        devices_resp = requests.get(
-            f"{VDOINTEL_BASE_URL}/devices?status=1&limit=1&lastid=1",
-            headers=headers
-        )
+    def iter_devices(self, status=1):
+        # Keyset pagination: each page starts after the highest device id of the previous one. Device ids start
+        # at 1, so lastid=0 includes the first device; a server that treats lastid as inclusive repeats the
+        # boundary device, which is dropped here
+        last_id = 0
+        seen = set()
+        while True:
+            page = self.get("/devices", {"status": status, "limit": self.page_size, "lastid": last_id})
+            if not page:
+                return
+            for dev in page:
+                if dev.get("id") is None or dev["id"] not in seen:
+                    seen.add(dev.get("id"))
+                    yield dev
+            ids = [int(dev["id"]) for dev in page if dev.get("id") is not None]
+            if len(page) < self.page_size or not ids or max(ids) <= last_id:
+                return
+            last_id = max(ids)
 
-        if devices_resp.status_code == 200:
-            devices = devices_resp.json()
-            return [
-                (dev["devicename"], safe_rtsp_url(dev["substream"]))
-                for dev in devices
-                if dev.get("substream")
-            ]
-        else:
-            print("❌ Failed to fetch device list.")
-            return []
-    except Exception as e:
-        print("❌ Exception:", str(e))
-        return []
+    def streams(self):
+        return [
+            (dev["devicename"], safe_rtsp_url(dev["substream"]))
+            for dev in self.iter_devices()
+            if dev.get("substream")
+        ]
+
+_client = None
+_streams = (0.0, [])
+_streams_lock = threading.Lock()
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = VdointelClient()
+    return _client
+
+def get_rtsp_streams(ttl=DEVICE_LIST_TTL):
+    # Reruns within ttl get the cached list; a failed refresh keeps serving the last good one
+    global _streams
+    with _streams_lock:
+        fetched_at, streams = _streams
+        if streams and time.monotonic() - fetched_at < ttl:
+            return streams
+        try:
+            streams = get_client().streams()
+            _streams = (time.monotonic(), streams)
+            logger.info(f"Discovered {len(streams)} RTSP streams")
+        except Exception as e:
+            logger.error(f"RTSP stream discovery failed: {e}")
+        return streams
 
 def fetch_rtsp_frame_ffmpeg(rtsp_url: str, width: int = 640, height: int = 480, timeout: int = 5) -> np.ndarray:
+    import ffmpeg
+
+    process = None
     try:
         process = (
             ffmpeg
@@ -82,16 +165,76 @@ def fetch_rtsp_frame_ffmpeg(rtsp_url: str, width: int = 640, height: int = 480,
             .run_async(pipe_stdout=True, pipe_stderr=True)
         )
 
-        out, err = process.communicate()
+        # t only bounds the read once connected; a camera that never answers must not hang the caller
+        out, err = process.communicate(timeout=timeout * 2)
         if err:
-            print("FFmpeg stderr: ", err.decode(errors='ignore'))
-        
+            logger.debug("FFmpeg stderr: %s", err.decode(errors='ignore'))
+
         frame = (
             np
             .frombuffer(out, np.uint8)
             .reshape([height, width, 3])
         )
         return frame
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.communicate()
+        logger.warning(f"FFmpeg frame grab timed out after {timeout * 2}s")
+        return None
     except Exception as e:
-        print("❌ FFmpeg frame grab error:", str(e))
-        return None
\ No newline at end of file
+        logger.error(f"FFmpeg frame grab error: {e}")
+        return None
+
+class SnapshotCache:
+    def __init__(self, ttl=30.0, max_workers=8, width=320, height=180, timeout=5, fetch=fetch_rtsp_frame_ffmpeg):
+        self.ttl = ttl
+        self.width = width
+        self.height = height
+        self.timeout = timeout
+        self.fetch = fetch
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="snapshot")
+        self.lock = threading.Lock()
+        self.frames = {}
+        self.pending = {}
+
+    def _fresh(self, url):
+        entry = self.frames.get(url)
+        return entry is not None and time.monotonic() - entry[0] < self.ttl
+
+    def _grab(self, url):
+        frame = None
+        try:
+            frame = self.fetch(url, width=self.width, height=self.height, timeout=self.timeout)
+            return frame
+        finally:
+            # Failed grabs are cached too, so a dead camera is not retried on every rerun
+            with self.lock:
+                previous = self.frames.get(url, (0.0, None))[1]
+                self.frames[url] = (time.monotonic(), frame if frame is not None else previous)
+                self.pending.pop(url, None)
+
+    def refresh(self, urls):
+        # Starts a background grab for every stale url that is not already being fetched
+        with self.lock:
+            for url in urls:
+                if not self._fresh(url) and url not in self.pending:
+                    self.pending[url] = self.pool.submit(self._grab, url)
+            return [self.pending[url] for url in urls if url in self.pending]
+
+    def get_many(self, urls, timeout=0.0):
+        # Returns the newest thumbnail per url (None if none yet), waiting up to timeout for stale ones
+        futures = self.refresh(urls)
+        if futures and timeout:
+            wait(futures, timeout=timeout)
+        with self.lock:
+            return {url: self.frames.get(url, (0.0, None))[1] for url in urls}
+
+    def get(self, url, timeout=None):
+        futures = self.refresh([url])
+        if futures:
+            wait(futures, timeout=timeout)
+        with self.lock:
+            return self.frames.get(url, (0.0, None))[1]
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)